@@ -1,7 +1,8 @@
 #!/usr/bin/env python3
 import re, os, sys, subprocess, json, base64, io, errno
 import posixpath
-import threading, random, shutil, struct, time, math, tarfile
+import random, shutil, struct, time, math, tarfile, selectors, signal, statistics
+import hashlib, mmap, itertools, stat, tempfile
 
 A1_PROG = "a1"
 VERBOSE = False
@@ -9,6 +10,12 @@ VALGRIND = False
 TIME_LIMIT = 4
 
 COMPILE_LOG_FILE_NAME = "compile_log.txt"
+RESULTS_FILE_NAME = "results.json"
+
+# generated test fixtures and compiled submissions are cached here; set OS_TESTER_CACHE="" to disable
+CACHE_DIR = os.environ.get("OS_TESTER_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "os-tester"))
+FIXTURE_CACHE_MAX_SIZE = 512 * 1024 * 1024
+BUILD_CACHE_MAX_SIZE = 256 * 1024 * 1024
 
 try:
     import docker
@@ -16,12 +23,172 @@ try:
 except ModuleNotFoundError:
     DOCKER_AVAILABLE = False
 
-class Tester(threading.Thread):
+# the process runner below is the same in the a1, a2 and a3 testers: every tester directory
+# is copied on its own into the grading container, so it cannot import a shared module;
+# a change to it must be made in all three copies
+
+# how often the processes are polled when the kernel has no pidfd support
+POLL_INTERVAL = 0.01
+
+# a test process supervised by runProcesses(); it runs in its own session,
+# so that it can be killed together with all the processes it creates
+class TestProcess:
+    def __init__(self, cmd, timeLimit, capture=False, quiet=True, env=None):
+        self.cmd = cmd
+        self.timeLimit = timeLimit
+        self.capture = capture
+        self.quiet = quiet
+        self.env = env
+        self.p = None
+        self.pidfd = None
+        self.streams = {}
+        self.output = []
+        self.err = []
+        self.startTime = None
+        self.deadline = None
+        self.elapsed = None
+        self.userTime = None
+        self.sysTime = None
+        self.timeout = False
+        self.exited = False
+
+    def start(self, selector):
+        if self.capture:
+            stdout = stderr = subprocess.PIPE
+        elif self.quiet:
+            stdout = stderr = subprocess.DEVNULL
+        else:
+            stdout = stderr = None
+        self.startTime = time.perf_counter()
+        self.deadline = self.startTime + self.timeLimit
+        try:
+            self.p = subprocess.Popen(self.cmd, stdout=stdout, stderr=stderr, env=self.env, start_new_session=True)
+        except OSError as e:
+            # a missing or broken binary counts as a test that produced no output
+            self.err.append(str(e).encode())
+            self.elapsed = 0
+            self.exited = True
+            return
+        if self.capture:
+            for stream, chunks in ((self.p.stdout, self.output), (self.p.stderr, self.err)):
+                os.set_blocking(stream.fileno(), False)
+                self.streams[stream] = chunks
+                selector.register(stream, selectors.EVENT_READ, self)
+        try:
+            self.pidfd = os.pidfd_open(self.p.pid)
+            selector.register(self.pidfd, selectors.EVENT_READ, self)
+        except (AttributeError, OSError):
+            self.pidfd = None
+
+    def handle(self, selector, fileobj):
+        if fileobj in self.streams:
+            self.readStream(selector, fileobj)
+        else:
+            self.checkExit(selector)
+
+    def readStream(self, selector, stream):
+        try:
+            chunk = os.read(stream.fileno(), 65536)
+        except BlockingIOError:
+            return
+        if chunk:
+            self.streams[stream].append(chunk)
+        else:
+            selector.unregister(stream)
+            del self.streams[stream]
+            stream.close()
+
+    def checkExit(self, selector):
+        if self.exited or os.waitid(os.P_PID, self.p.pid, os.WEXITED | os.WNOHANG | os.WNOWAIT) is None:
+            return
+        self.elapsed = time.perf_counter() - self.startTime
+        self.exited = True
+        # the process is not reaped yet, so its id still names the process group
+        # and the processes left behind can be killed safely
+        self.kill()
+        # the resource usage includes the children that the process waited for
+        _pid, status, usage = os.wait4(self.p.pid, 0)
+        self.p.returncode = os.waitstatus_to_exitcode(status)
+        self.userTime = usage.ru_utime
+        self.sysTime = usage.ru_stime
+        if self.pidfd is not None:
+            selector.unregister(self.pidfd)
+            os.close(self.pidfd)
+            self.pidfd = None
+
+    def kill(self):
+        if self.p is None or self.p.returncode is not None:
+            return
+        try:
+            os.killpg(self.p.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    def done(self):
+        return self.exited and len(self.streams) == 0
+
+    def getOutput(self):
+        return b"".join(self.output)
+
+    def getErrors(self):
+        return b"".join(self.err)
+
+# wall time and CPU times are in seconds; there is no peak RSS, since the kernel keeps the
+# peak RSS across exec and ru_maxrss would report the RSS of the tester at the time of the fork
+def getTestResult(name, score, maxScore, proc):
+    return {"name": name, "score": score, "max_score": maxScore, "timeout": proc.timeout,
+            "wall_time": proc.elapsed, "user_time": proc.userTime, "sys_time": proc.sysTime}
+
+# runs the processes from a single event loop, with at most jobs of them at the same time;
+# onStart is called right after each process is started
+def runProcesses(procs, jobs=1, onStart=None):
+    selector = selectors.DefaultSelector()
+    waiting = list(reversed(procs))
+    running = []
+    try:
+        while len(waiting) > 0 or len(running) > 0:
+            while len(waiting) > 0 and len(running) < jobs:
+                proc = waiting.pop()
+                proc.start(selector)
+                running.append(proc)
+                if onStart is not None:
+                    onStart(proc)
+            # a process that could not be started is already done and has nothing to wait for
+            running = [proc for proc in running if not proc.done()]
+            if len(running) == 0:
+                continue
+            timeout = None
+            deadlines = [proc.deadline for proc in running if not proc.exited and not proc.timeout]
+            if len(deadlines) > 0:
+                timeout = max(0, min(deadlines) - time.perf_counter())
+            if any(proc.pidfd is None and not proc.exited for proc in running):
+                timeout = POLL_INTERVAL if timeout is None else min(timeout, POLL_INTERVAL)
+            for key, _events in selector.select(timeout):
+                key.data.handle(selector, key.fileobj)
+            now = time.perf_counter()
+            for proc in running:
+                if proc.pidfd is None:
+                    proc.checkExit(selector)
+                if not proc.exited and not proc.timeout and now >= proc.deadline:
+                    proc.timeout = True
+                    proc.kill()
+            running = [proc for proc in running if not proc.done()]
+    finally:
+        for proc in running:
+            proc.kill()
+            for stream in proc.streams:
+                stream.close()
+            if proc.pidfd is not None:
+                os.close(proc.pidfd)
+            if proc.p is not None:
+                proc.p.wait()
+        selector.close()
+
+class Tester:
     leaks = False
 
     def __init__(self, name, command, timeLimit, expectedOutput, unordered):
-        threading.Thread.__init__(self)
-        print("Testing %s..." % name, end="")
+        self.testName = name
         self.cmd = ["./%s" % A1_PROG] + command
         if VALGRIND:
             self.cmd = ["valgrind"] + self.cmd
@@ -30,28 +197,18 @@ class Tester(threading.Thread):
         self.unordered = unordered
         self.result = None
         self.leak = False
-        self.p = None
+        self.proc = TestProcess(self.cmd, timeLimit, capture=True)
 
-    def run(self):
-        self.p = subprocess.Popen(self.cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        output, err = self.p.communicate()
+    def execute(self):
+        runProcesses([self.proc])
+
+    def evaluate(self):
+        output = self.proc.getOutput()
         self.result = [line.strip().decode(errors="ignore") for line in output.strip().split(b"\n")]
-        if b"LEAK SUMMARY" in err:
+        if b"LEAK SUMMARY" in self.proc.getErrors():
             Tester.leaks = True
             self.leak = True
-
-    def perform(self):
-        timeout = False
-        self.start()
-        self.join(self.timeLimit)
-
-        if self.is_alive():
-            if self.p is not None:
-                self.p.kill()
-                timeout = True
-            self.join()
-
-        if timeout:
+        if self.proc.timeout:
             print("\033[1;31mTIME LIMIT EXCEEDED\033[0m")
         if self.unordered:
             verdict = (sorted(self.result) == sorted(self.expectedOutput))
@@ -67,10 +224,40 @@ class Tester(threading.Thread):
                 print("\tYour output: %s" % str(self.result))
             return 0
 
+    def perform(self):
+        print("Testing %s..." % self.testName, end="")
+        self.execute()
+        return self.evaluate()
+
+# with jobs > 1, up to jobs tests are executed at the same time,
+# but the results are still reported in the order of the tests list
+def runTests(tests, jobs=1):
+    testers = [Tester(t[0], t[1], getTimeLimit(t), t[3], t[4]) for t in tests]
+    score = 0
+    testResults = []
+    if jobs > 1:
+        runProcesses([tester.proc for tester in testers], jobs)
+    for tester in testers:
+        if jobs > 1:
+            print("Testing %s..." % tester.testName, end="")
+            testScore = tester.evaluate()
+        else:
+            testScore = tester.perform()
+        score += testScore
+        testResults.append(getTestResult(tester.testName, testScore, 1, tester.proc))
+    return score, testResults
+
+# version 1 draws every symbol with its own random.randint() call and reproduces
+# the already published test files; version 2 draws all the symbols at once
+GENERATOR_VERSION = 1
+NAME_SYMBOLS = b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijlmnopqrstuvwxyz1234567890"
+
 def genRandomName(length=0):
     symbols = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijlmnopqrstuvwxyz1234567890"
     if length == 0:
         length = random.randint(4, 10)
+    if GENERATOR_VERSION >= 2:
+        return bytes(random.choices(NAME_SYMBOLS, k=length))
     name = [symbols[random.randint(0, len(symbols)-1)] for _i in range(length)]
     return "".join(name).encode()
 
@@ -97,7 +284,15 @@ def genSectionBody(data, hugeLines):
             lineLen = random.randint(90000, 120000)
         else:
             lineLen = random.randint(20, 100)
-        body.append(genRandomName(lineLen))
+        if GENERATOR_VERSION >= 2:
+            body.append(lineLen)
+        else:
+            body.append(genRandomName(lineLen))
+    if GENERATOR_VERSION >= 2:
+        # generate the symbols of all the lines in one step, then cut them
+        symbols = genRandomName(sum(body))
+        lineEnds = list(itertools.accumulate(body))
+        body = [symbols[end-lineLen:end] for lineLen, end in zip(body, lineEnds)]
     if data["line_ending_win"]:
         sep = b"\x0D\x0A"
     else:
@@ -186,7 +381,10 @@ def genSectionFile(path, data, wrongMagic=False, wrongVersion=False, wrongSectNr
     os.chmod(path, perm)
 
 def get_perm(fpath):
-    perm = os.stat(fpath).st_mode & 0o777
+    return permString(os.stat(fpath).st_mode)
+
+def permString(mode):
+    perm = mode & 0o777
     res = []
     for _i in range(3):
         p = perm % 8
@@ -205,153 +403,370 @@ def get_perm(fpath):
             res.append("-")
     return "".join(res[::-1])
 
-def parseFile(data, fpath, section=None, line=None, findall=False, randomLine=False):
-    result = []
-    if not os.path.isfile(fpath):
-        result.append("ERROR")
-        result.append("inexistent file")
-        return result
-    fin = open(fpath, "rb")
-    content = fin.read()
-    fin.close()
+SECTION_STRUCTS = {}
+
+def getSectionStructs(data):
+    key = (data["version_size"], data["section_name_size"], data["section_type_size"])
+    if key not in SECTION_STRUCTS:
+        formats = {"1": "B", "2": "H"}
+        versionFormat = formats.get(data["version_size"], "I")
+        typeFormat = formats.get(data["section_type_size"], "I")
+        SECTION_STRUCTS[key] = (struct.Struct("=%sB" % versionFormat),
+                                struct.Struct("=%ds%sII" % (int(data["section_name_size"]), typeFormat)))
+    return SECTION_STRUCTS[key]
+
+def mapFile(fin):
+    if os.fstat(fin.fileno()).st_size == 0:
+        return b""
+    return mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ)
 
+# returns (error, version, nrSect, sections); only the header region of content is copied
+def readSectionTable(data, content):
     magicSize = int(data["magic_size"])
     if data["header_pos_end"]:
         magic = content[-magicSize:]
     else:
         magic = content[:magicSize]
     if magic != data["magic"].encode():
-        result.append("ERROR")
-        result.append("wrong magic")
-        return result
+        return "wrong magic", None, None, None
     if data["header_pos_end"]:
         hdrSize = struct.unpack("H", content[-magicSize-2:-magicSize])[0]
         hdr = content[-hdrSize:-magicSize-2]
     else:
         hdrSize = struct.unpack("H", content[magicSize:magicSize+2])[0]
         hdr = content[magicSize+2:hdrSize]
-    if data["version_size"] == "1":
-        version = struct.unpack("B", hdr[0:1])[0]
-        nrSect = struct.unpack("B", hdr[1:2])[0]
-        hdr = hdr[2:]
-    elif data["version_size"] == "2":
-        version = struct.unpack("H", hdr[:2])[0]
-        nrSect = struct.unpack("B", hdr[2:3])[0]
-        hdr = hdr[3:]
-    else:
-        version = struct.unpack("I", hdr[:4])[0]
-        nrSect = struct.unpack("B", hdr[4:5])[0]
-        hdr = hdr[5:]
+    hdrStruct, sectStruct = getSectionStructs(data)
+    version, nrSect = hdrStruct.unpack_from(hdr)
     if version < int(data["version_min"]) or version > int(data["version_max"]):
-        result.append("ERROR")
-        result.append("wrong version")
-        return result
+        return "wrong version", version, nrSect, None
     if nrSect < int(data["nr_sect_min"]) or nrSect > int(data["nr_sect_max"]):
-        result.append("ERROR")
-        result.append("wrong sect_nr")
-        return result
-    ns = int(data["section_name_size"])
-    ts = int(data["section_type_size"])
-    sectSize = ns + ts + 4 + 4
+        return "wrong sect_nr", version, nrSect, None
     sections = []
     for i in range(nrSect):
-        name = hdr[i*sectSize:i*sectSize+ns]
-        name = name.replace(b"\x00", b"")
-        type = hdr[i*sectSize+ns:i*sectSize+ns+ts]
-        if ts == 1:
-            type = struct.unpack("B", type)[0]
-        elif ts == 2:
-            type = struct.unpack("H", type)[0]
-        else:
-            type = struct.unpack("I", type)[0]
+        name, type, offset, size = sectStruct.unpack_from(hdr, hdrStruct.size + i * sectStruct.size)
         if str(type) not in data["section_types"]:
-            result.append("ERROR")
-            result.append("wrong sect_types")
-            return result
-        offset = struct.unpack("I", hdr[i*sectSize+ns+ts:i*sectSize+ns+ts+4])[0]
-        size = struct.unpack("I", hdr[i*sectSize+ns+ts+4:i*sectSize+ns+ts+8])[0]
-        sections.append((name, type, offset, size))
+            return "wrong sect_types", version, nrSect, None
+        sections.append((name.replace(b"\x00", b""), type, offset, size))
+    return None, version, nrSect, sections
+
+def getLineSeparator(data):
+    if data["line_ending_win"]:
+        return b"\x0D\x0A"
+    return b"\x0A"
+
+# same as len(content[offset:offset+size].split(sep)), without building the lines
+def countLines(content, offset, size, sep):
+    end = offset + size
+    count = 1
+    pos = content.find(sep, offset, end)
+    while pos != -1:
+        count += 1
+        pos = content.find(sep, pos + len(sep), end)
+    return count
+
+# same as content[offset:offset+size].split(sep)[index]
+def getLine(content, offset, size, sep, index):
+    end = offset + size
+    start = offset
+    for _i in range(index):
+        start = content.find(sep, start, end) + len(sep)
+    pos = content.find(sep, start, end)
+    if pos == -1:
+        pos = end
+    return content[start:pos]
+
+def parseFile(data, fpath, section=None, line=None, findall=False, randomLine=False):
+    if not os.path.isfile(fpath):
+        return ["ERROR", "inexistent file"]
+    fin = open(fpath, "rb")
+    content = mapFile(fin)
+    try:
+        return parseContent(data, content, section, line, findall, randomLine)
+    finally:
+        if isinstance(content, mmap.mmap):
+            content.close()
+        fin.close()
+
+def parseContent(data, content, section, line, findall, randomLine):
+    error, version, nrSect, sections = readSectionTable(data, content)
+    if error is not None:
+        return ["ERROR", error]
+    sep = getLineSeparator(data)
 
     if randomLine:
         sect = random.randint(0, nrSect - 1)
         _name, _type, offset, size = sections[sect]
-        if data["line_ending_win"]:
-            sep = b"\x0D\x0A"
-        else:
-            sep = b"\x0A"
-        lines = content[offset:offset+size].split(sep)
-        lineNr = random.randint(1, len(lines))
+        lineNr = random.randint(1, countLines(content, offset, size, sep))
         return (sect+1, lineNr)
     if section is None and not findall:
         # parse option was used
         result = ["SUCCESS", "version=%d" % version, "nr_sections=%d" % nrSect]
         for i, (name, type, _offset, size) in enumerate(sections):
             result.append("section%d: %s %d %d" % (i+1, name.decode(), type, size))
+        return result
     elif section is not None:
         # extract option was used
         if section > len(sections) or section < 1:
-            result.append("ERROR")
-            result.append("inexistent file")
-            return result
+            return ["ERROR", "inexistent file"]
         _name, _type, offset, size = sections[section-1]
-        if data["line_ending_win"]:
-            sep = b"\x0D\x0A"
-        else:
-            sep = b"\x0A"
-        lines = content[offset:offset+size].split(sep)
-        if line > len(lines) or line < 1:
-            result.append("ERROR")
-            result.append("inexistent line")
-            return result
+        nrLines = countLines(content, offset, size, sep)
+        if line > nrLines or line < 1:
+            return ["ERROR", "inexistent line"]
         if data["line_count_reversed"]:
-            crtLine = lines[-line]
+            crtLine = getLine(content, offset, size, sep, nrLines - line)
         else:
-            crtLine = lines[line-1]
+            crtLine = getLine(content, offset, size, sep, line - 1)
         if data["line_reversed"]:
             crtLine = crtLine[::-1]
-        result = ["SUCCESS", crtLine.decode()]
-    elif findall:
+        return ["SUCCESS", crtLine.decode()]
+    else:
         # findall option was used
-        if data["findall"] == "n_sect_type_t":
-            n = int(data["findall_param1"])
-            t = int(data["findall_param2"])
-            for (_name, type, _offset, _size) in sections:
-                if type == t:
-                    n -= 1
-            if n <= 0:
-                return True
-        elif data["findall"] == "sect_more_l_lines":
-            l = int(data["findall_param1"])
-            if data["line_ending_win"]:
-                sep = b"\x0D\x0A"
-            else:
-                sep = b"\x0A"
-            for (_name, _type, offset, size) in sections:
-                lines = content[offset:offset+size].split(sep)
-                if len(lines) > l:
-                    return True
-        elif data["findall"] == "s_sect_l_lines":
-            s = int(data["findall_param1"])
-            l = int(data["findall_param2"])
-            if data["line_ending_win"]:
-                sep = b"\x0D\x0A"
+        needLines = data["findall"] in ("sect_more_l_lines", "s_sect_l_lines")
+        summary = [(type, size, countLines(content, offset, size, sep) if needLines else None)
+                    for (_name, type, offset, size) in sections]
+        return findallMatch(data, summary)
+
+# sections is a list of (type, size, number of lines) tuples
+def findallMatch(data, sections):
+    if data["findall"] == "n_sect_type_t":
+        n = int(data["findall_param1"])
+        t = int(data["findall_param2"])
+        return len([type for (type, _size, _lines) in sections if type == t]) >= n
+    elif data["findall"] == "sect_more_l_lines":
+        l = int(data["findall_param1"])
+        return any(lines > l for (_type, _size, lines) in sections)
+    elif data["findall"] == "s_sect_l_lines":
+        s = int(data["findall_param1"])
+        l = int(data["findall_param2"])
+        return len([lines for (_type, _size, lines) in sections if lines == l]) >= s
+    elif data["findall"] == "no_sect_size_s":
+        s = int(data["findall_param1"])
+        return all(size <= s for (_type, size, _lines) in sections)
+    return False
+
+def summarizeFile(data, fpath):
+    fin = open(fpath, "rb")
+    content = mapFile(fin)
+    try:
+        error, _version, _nrSect, sections = readSectionTable(data, content)
+        if error is not None:
+            return None
+        sep = getLineSeparator(data)
+        return [(type, size, countLines(content, offset, size, sep)) for (_name, type, offset, size) in sections]
+    finally:
+        if isinstance(content, mmap.mmap):
+            content.close()
+        fin.close()
+
+# the section index of a tree is kept next to it, not inside it, where the tests would list it
+SECTION_INDEX_SUFFIX = ".section_index.json"
+SECTION_LAYOUT_KEYS = ("magic", "magic_size", "header_pos_end", "version_size", "version_min", "version_max",
+                        "nr_sect_min", "nr_sect_max", "section_name_size", "section_type_size",
+                        "section_types", "line_ending_win")
+
+# On-disk index with the (type, size, number of lines) sections of every parsed file,
+# keyed by the file path and validated by its size and mtime, so that repeated findall
+# queries over the same tree only parse the files that changed. The files that no longer
+# exist are dropped when the index is saved.
+class SectionIndex:
+    def __init__(self, data, path):
+        self.data = data
+        self.path = path
+        layout = {k: data[k] for k in SECTION_LAYOUT_KEYS}
+        self.layout = hashlib.sha256(json.dumps(layout, sort_keys=True).encode()).hexdigest()
+        self.files = {}
+        self.dirty = False
+        if os.path.isfile(path):
+            try:
+                fin = open(path)
+                saved = json.load(fin)
+                fin.close()
+                if saved.get("layout") == self.layout:
+                    self.files = saved["files"]
+            except (OSError, ValueError):
+                pass
+
+    # returns None for files that are not valid section files
+    def getSummary(self, fpath, st=None):
+        if st is None:
+            try:
+                st = os.stat(fpath)
+            except OSError:
+                return None
+        if not stat.S_ISREG(st.st_mode):
+            return None
+        key = os.path.abspath(os.fsdecode(fpath))
+        record = self.files.get(key)
+        if record is None or record[0] != st.st_size or record[1] != st.st_mtime_ns:
+            record = [st.st_size, st.st_mtime_ns, summarizeFile(self.data, fpath)]
+            self.files[key] = record
+            self.dirty = True
+        return record[2]
+
+    def findall(self, fpath, st=None):
+        summary = self.getSummary(fpath, st)
+        return summary is not None and findallMatch(self.data, summary)
+
+    def save(self):
+        if not self.dirty:
+            return
+        self.files = {key: record for key, record in self.files.items() if os.path.isfile(key)}
+        tmpPath = "%s.tmp%d" % (self.path, os.getpid())
+        fout = open(tmpPath, "w")
+        json.dump({"layout": self.layout, "files": self.files}, fout)
+        fout.close()
+        os.replace(tmpPath, self.path)
+        self.dirty = False
+
+def getSectionIndexPath(root):
+    return os.path.normpath(os.fsdecode(root)) + SECTION_INDEX_SUFFIX
+
+# yields the entries that os.listdir() or os.walk() would list
+def scanEntries(path, recursive):
+    try:
+        with os.scandir(path) as it:
+            entries = list(it)
+    except OSError:
+        return
+    for entry in entries:
+        yield entry
+        if recursive and entry.is_dir(follow_symlinks=False):
+            yield from scanEntries(entry.path, recursive)
+
+# returns the name filters and the filters that need the (followed) stat of an entry
+def getListFilters(options):
+    nameFilters = []
+    statFilters = []
+    if "name_starts_with" in options:
+        prefix = options["name_starts_with"]
+        nameFilters.append(lambda name: name.startswith(prefix))
+    if "name_ends_with" in options:
+        suffix = options["name_ends_with"]
+        nameFilters.append(lambda name: name.endswith(suffix))
+    if "size_greater" in options:
+        minSize = int(options["size_greater"])
+        statFilters.append(lambda st: stat.S_ISREG(st.st_mode) and st.st_size > minSize)
+    if "size_smaller" in options:
+        maxSize = int(options["size_smaller"])
+        statFilters.append(lambda st: stat.S_ISREG(st.st_mode) and st.st_size < maxSize)
+    if "permissions" in options:
+        perm = options["permissions"]
+        statFilters.append(lambda st: permString(st.st_mode) == perm)
+    if "has_perm_execute" in options:
+        statFilters.append(lambda st: st.st_mode & stat.S_IXUSR != 0)
+    if "has_perm_write" in options:
+        statFilters.append(lambda st: st.st_mode & stat.S_IWUSR != 0)
+    return nameFilters, statFilters
+
+# every entry is stat'ed at most once and all the filters are applied in a single pass
+def listDir(path, options, index=None):
+    nameFilters, statFilters = getListFilters(options)
+    if index is not None:
+        entries = index.scan(path, "recursive" in options)
+    else:
+        entries = scanEntries(path, "recursive" in options)
+    results = []
+    for entry in entries:
+        if not all(f(entry.name) for f in nameFilters):
+            continue
+        if len(statFilters) > 0:
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            if not all(f(st) for f in statFilters):
+                continue
+        results.append(entry.path)
+    results.sort()
+    return results
+
+class IndexEntry:
+    def __init__(self, path, name, st, isDir):
+        self.path = path
+        self.name = name
+        # stat following the symlinks, None for broken links
+        self.st = st
+        # True only for real directories, that os.walk() descends into
+        self.isDir = isDir
+
+    def stat(self):
+        if self.st is None:
+            raise FileNotFoundError(self.path)
+        return self.st
+
+# Metadata of a test tree that does not change while the tests are generated.
+# The tree is walked once and every reference computation queries the index
+# instead of the filesystem; the findall verdicts are memoized per file and,
+# when a SectionIndex is given, also kept on disk between runs.
+class FsIndex:
+    def __init__(self, data, root, sectionIndex=None):
+        self.data = data
+        self.sectionIndex = sectionIndex
+        self.children = {}
+        self.entries = {}
+        self.findallResults = {}
+        self.addDir(os.fsdecode(root))
+
+    def addDir(self, path):
+        children = []
+        for entry in scanEntries(path, False):
+            try:
+                st = entry.stat()
+            except OSError:
+                st = None
+            child = IndexEntry(entry.path, entry.name, st, entry.is_dir(follow_symlinks=False))
+            children.append(child)
+            self.entries[child.path] = child
+        self.children[path] = children
+        for child in children:
+            if child.isDir:
+                self.addDir(child.path)
+
+    def isdir(self, path):
+        return os.fsdecode(path) in self.children
+
+    def listdir(self, path):
+        names = [entry.name for entry in self.children[os.fsdecode(path)]]
+        if isinstance(path, bytes):
+            return [os.fsencode(name) for name in names]
+        return names
+
+    def scan(self, path, recursive):
+        for entry in self.children[path]:
+            yield entry
+            if recursive and entry.isDir:
+                yield from self.scan(entry.path, recursive)
+
+    # the files in the order of os.walk()
+    def walkFiles(self, path):
+        children = self.children[path]
+        for entry in children:
+            if entry.st is None or not stat.S_ISDIR(entry.st.st_mode):
+                yield entry.path
+        for entry in children:
+            if entry.isDir:
+                yield from self.walkFiles(entry.path)
+
+    def isfile(self, path):
+        entry = self.entries.get(os.fsdecode(path))
+        return entry is not None and entry.st is not None and stat.S_ISREG(entry.st.st_mode)
+
+    def getsize(self, path):
+        return self.entries[os.fsdecode(path)].stat().st_size
+
+    def getPerm(self, path):
+        return permString(self.entries[os.fsdecode(path)].stat().st_mode)
+
+    def findall(self, fpath):
+        if fpath not in self.findallResults:
+            if self.sectionIndex is not None:
+                self.findallResults[fpath] = self.sectionIndex.findall(fpath, self.entries[fpath].st)
             else:
-                sep = b"\x0A"
-            for (_name, _type, offset, size) in sections:
-                lines = content[offset:offset+size].split(sep)
-                if len(lines) == l:
-                    s -= 1
-            if s<= 0:
-                return True
-        elif data["findall"] == "no_sect_size_s":
-            s = int(data["findall_param1"])
-            for (_name, _type, _offset, size) in sections:
-                if size > s:
-                    return False
-            return True
-    return result
-
-def perform_a1(data, cmd):
+                self.findallResults[fpath] = (parseFile(self.data, fpath, findall=True) == True)
+        return self.findallResults[fpath]
+
+# findall answers from the on-disk section index at sectionIndexPath, if one is given
+def perform_a1(data, cmd, index=None, sectionIndexPath=None):
     if len(cmd) == 0:
         return []
     if cmd[0] == "variant":
@@ -363,7 +778,9 @@ def perform_a1(data, cmd):
         if not mx:
             return []
         path = mx.group(1)
-        if not os.path.isdir(path):
+        if index is not None and not index.isdir(path):
+            index = None
+        if index is None and not os.path.isdir(path):
             return []
         options = {}
         for opt in cmd[1:-1]:
@@ -375,30 +792,7 @@ def perform_a1(data, cmd):
                 optKey = opt
                 optValue = None
             options[optKey] = optValue
-        results = []
-        if "recursive" in options:
-            for root, dirs, files in os.walk(path):
-                for name in dirs + files:
-                    results.append(os.path.join(root, name))
-        else:
-            results = [os.path.join(path, name) for name in os.listdir(path)]
-        results.sort()
-        
-        if "name_starts_with" in options:
-            results = [x for x in results if os.path.basename(x).startswith(options["name_starts_with"])]
-        if "name_ends_with" in options:
-            results = [x for x in results if os.path.basename(x).endswith(options["name_ends_with"])]
-        if "size_greater" in options:
-            results = [x for x in results if os.path.isfile(x) and os.path.getsize(x) > int(options["size_greater"])]
-        if "size_smaller" in options:
-            results = [x for x in results if os.path.isfile(x) and os.path.getsize(x) < int(options["size_smaller"])]
-        if "permissions" in options:
-            results = [x for x in results if get_perm(x) == options["permissions"]]
-        if "has_perm_execute" in options:
-            results = [x for x in results if get_perm(x)[2] == "x"]
-        if "has_perm_write" in options:
-            results = [x for x in results if get_perm(x)[1] == "w"]
-
+        results = listDir(path, options, index)
         return ["SUCCESS"] + results
     elif cmd[0] == "parse":
         if len(cmd) < 2:
@@ -426,21 +820,156 @@ def perform_a1(data, cmd):
         if not mx:
             return []
         path = mx.group(1)
+        if index is not None and index.isdir(path):
+            return ["SUCCESS"] + [fpath for fpath in index.walkFiles(path) if index.findall(fpath)]
+        sectionIndex = None
+        if sectionIndexPath is not None:
+            sectionIndex = SectionIndex(data, sectionIndexPath)
         for root, _dirs, files in os.walk(path):
             for name in files:
                 fpath = os.path.join(root, name)
-                if parseFile(data, fpath, findall=True) == True:
+                if sectionIndex is not None:
+                    found = sectionIndex.findall(fpath)
+                else:
+                    found = parseFile(data, fpath, findall=True) == True
+                if found:
                     results.append(fpath)
+        if sectionIndex is not None:
+            sectionIndex.save()
         return ["SUCCESS"] + results
 
-def compute_time(fn, *args):
-    t1 = time.time()
-    result = fn(*args)
-    t2 = time.time()
-    t = int(math.ceil(2*(t2 - t1)))
+# the reference solution is timed CALIBRATION_REPEATS times; its median time is stored
+# in the test, together with the speed probe of the machine that generated the tests,
+# so that the time limit can be rescaled to the machine that runs the tests
+CALIBRATION_REPEATS = 3
+TIME_LIMIT_FACTOR = 2
+PROBE_REPEATS = 5
+MIN_SPEED_SCALE = 0.5
+MAX_SPEED_SCALE = 4.0
+SPEED_PROBE = None
+
+# the submissions are C programs, so the probe is a fixed CPU and memory workload in C,
+# built with the same compiler; it prints the best time of its runs
+SPEED_PROBE_SOURCE = r"""
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <time.h>
+
+#define N (1 << 18)
+
+static int cmp(const void *a, const void *b)
+{
+    unsigned int x = *(const unsigned int*)a, y = *(const unsigned int*)b;
+    return (x > y) - (x < y);
+}
+
+int main(int argc, char **argv)
+{
+    int repeats = argc > 1 ? atoi(argv[1]) : 1;
+    unsigned int *v = malloc(N * sizeof(unsigned int));
+    char *buf = malloc(4 * N), *copy = malloc(4 * N);
+    unsigned int h = 2166136261u;
+    double best = -1;
+    if(v == NULL || buf == NULL || copy == NULL) {
+        return 1;
+    }
+    for(int r = 0; r < repeats; r++) {
+        struct timespec t1, t2;
+        clock_gettime(CLOCK_MONOTONIC, &t1);
+        for(int i = 0; i < N; i++) {
+            h = (h ^ (unsigned int)i) * 16777619u;
+            v[i] = h;
+        }
+        qsort(v, N, sizeof(unsigned int), cmp);
+        memset(buf, (int)(v[N / 2] & 0xff), 4 * N);
+        memcpy(copy, buf, 4 * N);
+        h ^= (unsigned char)copy[h % (4 * N)];
+        clock_gettime(CLOCK_MONOTONIC, &t2);
+        double t = (t2.tv_sec - t1.tv_sec) + (t2.tv_nsec - t1.tv_nsec) / 1e9;
+        if(best < 0 || t < best) {
+            best = t;
+        }
+    }
+    printf("%.9f %u\\n", best, h);
+    return 0;
+}
+"""
+
+def runCSpeedProbe():
+    tmpDir = tempfile.mkdtemp(prefix="a1_probe_")
+    try:
+        src = os.path.join(tmpDir, "probe.c")
+        prog = os.path.join(tmpDir, "probe")
+        with open(src, "w") as fout:
+            fout.write(SPEED_PROBE_SOURCE)
+        if subprocess.call(["gcc", "-O2", src, "-o", prog],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) != 0:
+            return None
+        out = subprocess.run([prog, str(PROBE_REPEATS)], stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL, timeout=60).stdout
+        return float(out.split()[0])
+    except (OSError, ValueError, IndexError, subprocess.TimeoutExpired):
+        return None
+    finally:
+        shutil.rmtree(tmpDir, ignore_errors=True)
+
+# without a compiler the probe falls back to a similar workload in Python;
+# the two kinds of probes are not comparable, so the kind is stored next to the value
+def runPythonSpeedProbe():
+    times = []
+    for _i in range(PROBE_REPEATS):
+        t1 = time.perf_counter()
+        h = hashlib.sha256()
+        for i in range(20000):
+            h.update(b"%d" % i)
+        sorted(range(100000, 0, -1), key=lambda x: x % 1000)
+        times.append(time.perf_counter() - t1)
+    return min(times)
+
+def getSpeedProbe():
+    global SPEED_PROBE
+    if SPEED_PROBE is None:
+        probe = runCSpeedProbe()
+        if probe is not None and probe > 0:
+            SPEED_PROBE = ("c", probe)
+        else:
+            SPEED_PROBE = ("python", runPythonSpeedProbe())
+    return SPEED_PROBE
+
+# the expected result comes from the indexed reference solution, but the time is measured
+# on the plain one, without the file system index and the section index, whose cached
+# answers would make the reference time meaningless
+def compute_time(data, cmd, index):
+    result = perform_a1(data, cmd, index)
+    times = []
+    for _i in range(CALIBRATION_REPEATS):
+        t1 = time.perf_counter()
+        perform_a1(data, cmd)
+        times.append(time.perf_counter() - t1)
+    refTime = statistics.median(times)
+    t = int(math.ceil(TIME_LIMIT_FACTOR * refTime))
     if t < TIME_LIMIT:
         t = TIME_LIMIT
-    return t, result
+    probeKind, probe = getSpeedProbe()
+    calibration = {"ref_time": refTime, "probe": probe, "probe_kind": probeKind, "limit": t}
+    return t, result, calibration
+
+# tests without calibration keep their fixed time limit, and so do the tests calibrated
+# with another kind of probe or without a usable probe; the scaled limit is never below TIME_LIMIT
+def getTimeLimit(test):
+    if len(test) < 6:
+        return test[2]
+    calibration = test[5]
+    probeKind, probe = getSpeedProbe()
+    if calibration.get("probe_kind", "python") != probeKind:
+        return calibration["limit"]
+    refProbe = calibration.get("probe")
+    if not isinstance(refProbe, (int, float)) or refProbe <= 0:
+        return calibration["limit"]
+    scale = probe / refProbe
+    scale = min(MAX_SPEED_SCALE, max(MIN_SPEED_SCALE, scale))
+    return max(TIME_LIMIT, calibration["limit"] * scale)
 
 def makeRandomFiles(data, count, dirs):
     allFiles = []
@@ -506,8 +1035,8 @@ def shuffle(l):
         l[i] = l[j]
         l[j] = aux
 
-def getSizeInterval(items):
-    sizes = [os.path.getsize(x) for x in items if os.path.isfile(x)]
+def getSizeInterval(items, index):
+    sizes = [index.getsize(x) for x in items if index.isfile(x)]
     if len(sizes) < 3:
         return None, None
     return min(sizes), max(sizes)
@@ -515,6 +1044,8 @@ def getSizeInterval(items):
 def generateTests(data):
     random.seed(data["variant"] + data["name"])
     dirs, files, corrupted, huge = buildTestFs(data)
+    sectionIndex = SectionIndex(data, getSectionIndexPath(dirs[0]))
+    index = FsIndex(data, dirs[0], sectionIndex)
     tests = []
     # variant
     tests.append([  "variant", # test name
@@ -529,14 +1060,15 @@ def generateTests(data):
     count = 0
     for path in dirs1:
         cmd = ["list", "path=%s" % path.decode()]
-        timeLimit, result = compute_time(perform_a1, data, cmd)
+        timeLimit, result, calibration = compute_time(data, cmd, index)
         if (count < 4 and len(result) > 0) or len(result) > 2:
             count += 1
             tests.append([  "simple_listing_%d" % count,
                             cmd,
                             timeLimit,
                             result,
-                            True
+                            True,
+                            calibration
                 ])
             if count >= 5:
                 break
@@ -549,14 +1081,15 @@ def generateTests(data):
     count = 0
     for path in dirs1:
         cmd = ["list", "recursive", "path=%s" % path.decode()]
-        timeLimit, result = compute_time(perform_a1, data, cmd)
+        timeLimit, result, calibration = compute_time(data, cmd, index)
         if (count < 4 and len(result) > 0) or len(result) > 2:
             count += 1
             tests.append([  "recursive_listing_%d" % count,
                             cmd,
                             timeLimit,
                             result,
-                            True
+                            True,
+                            calibration
                 ])
             if count >= 5:
                 break
@@ -573,23 +1106,24 @@ def generateTests(data):
                 filter = "size_greater"
             else:
                 filter = "size_smaller"
-            minSize, maxSize = getSizeInterval([os.path.join(path, x) for x in os.listdir(path)])
+            minSize, maxSize = getSizeInterval([os.path.join(path, x) for x in index.listdir(path)], index)
             if minSize is not None:
                 size = random.randint(minSize, maxSize)
                 cmd = ["list", "%s=%d" % (filter, size), "path=%s" % path.decode()]
                 if countSize % 2 == 1:
                     cmd.insert(random.randint(1, 2), "recursive")
-                timeLimit, result = compute_time(perform_a1, data, cmd)
+                timeLimit, result, calibration = compute_time(data, cmd, index)
                 if len(result) > 1:
                     countSize += 1
                     tests.append([  "%s_%d" % (filter, countSize),
                                     cmd,
                                     timeLimit,
                                     result,
-                                    True
+                                    True,
+                                    calibration
                         ])
         if countName < 6 and (data["filter_name_starts_with"] or data["filter_name_ends_with"]):
-            names = os.listdir(path)
+            names = index.listdir(path)
             if len(names) >= 3:
                 sample = names[random.randint(0, len(names)-1)]
                 if data["filter_name_starts_with"]:
@@ -602,22 +1136,23 @@ def generateTests(data):
                 cmd = ["list", "%s=%s" % (filter, substr), "path=%s" % path.decode()]
                 if countSize % 2 == 1:
                     cmd.insert(random.randint(1, 2), "recursive")
-                timeLimit, result = compute_time(perform_a1, data, cmd)
+                timeLimit, result, calibration = compute_time(data, cmd, index)
                 if len(result) > 1:
                     countName += 1
                     tests.append([  "%s_%d" % (filter, countName),
                                     cmd,
                                     timeLimit,
                                     result,
-                                    True
+                                    True,
+                                    calibration
                         ])
         if countPerm < 6 and (data["filter_permissions"] or data["filter_has_perm_execute"] or data["filter_has_perm_write"]):
-            names = os.listdir(path)
+            names = index.listdir(path)
             if len(names) >= 2:
                 if data["filter_permissions"]:
                     filter = "permissions"
                     sample = names[random.randint(0, len(names)-1)]
-                    perm = get_perm(os.path.join(path, sample))
+                    perm = index.getPerm(os.path.join(path, sample))
                     cmd = ["list", "permissions=%s" % perm, "path=%s" % path.decode()]
                     if countSize % 2 == 1:
                         cmd.insert(random.randint(1, 2), "recursive")
@@ -629,14 +1164,15 @@ def generateTests(data):
                     cmd = ["list", filter, "path=%s" % path.decode()]
                     if countSize % 2 == 1:
                         cmd.insert(random.randint(1, 2), "recursive")
-                timeLimit, result = compute_time(perform_a1, data, cmd)
+                timeLimit, result, calibration = compute_time(data, cmd, index)
                 if len(result) > 1:
                     countPerm += 1
                     tests.append([  "%s_%d" % (filter, countPerm),
                                     cmd,
                                     timeLimit,
                                     result,
-                                    True
+                                    True,
+                                    calibration
                         ])
     # parsing section files
     files1 = files[:]
@@ -644,22 +1180,24 @@ def generateTests(data):
     files1 = files1[:10]
     for count, path in enumerate(files1):
         cmd = ["parse", "path=%s" % path.decode()]
-        timeLimit, result = compute_time(perform_a1, data, cmd)
+        timeLimit, result, calibration = compute_time(data, cmd, index)
         tests.append([  "parse_%d" % (count+1),
                                 cmd,
                                 timeLimit,
                                 result,
-                                False
+                                False,
+                                calibration
                     ])
     # corrupted files
     for count, path in enumerate(corrupted):
         cmd = ["parse", "path=%s" % path.decode()]
-        timeLimit, result = compute_time(perform_a1, data, cmd)
+        timeLimit, result, calibration = compute_time(data, cmd, index)
         tests.append([  "corrupted_%d" % (count+1),
                                 cmd,
                                 timeLimit,
                                 result,
-                                False
+                                False,
+                                calibration
                     ])
 
     # extracting lines
@@ -669,12 +1207,13 @@ def generateTests(data):
     for count, path in enumerate(files1):
         sectNr, lineNr = parseFile(data, path, randomLine=True)
         cmd = ["extract", "path=%s" % path.decode(), "section=%d" % sectNr, "line=%d" % lineNr]
-        timeLimit, result = compute_time(perform_a1, data, cmd)
+        timeLimit, result, calibration = compute_time(data, cmd, index)
         tests.append([  "extract_%d" % (count+1),
                                 cmd,
                                 timeLimit,
                                 result,
-                                False
+                                False,
+                                calibration
                     ])
 
     # findall
@@ -685,19 +1224,22 @@ def generateTests(data):
     count = 0
     for path in dirs1:
         cmd = ["findall", "path=%s" % path.decode()]
-        timeLimit, result = compute_time(perform_a1, data, cmd)
+        timeLimit, result, calibration = compute_time(data, cmd, index)
         if len(result) > 0:
             count += 1
             tests.append([  "findall_%d" % count,
                             cmd,
                             timeLimit,
                             result,
-                            True
+                            True,
+                            calibration
                 ])
             if count >= 8:
                 break
 
 
+    sectionIndex.save()
+
     #save tests to file
     fout = open("tests.json", "w")
     json.dump(tests, fout, indent=4)
@@ -707,13 +1249,16 @@ def generateTests(data):
 def compile():
     if os.path.isfile(A1_PROG):
         os.remove(A1_PROG)
-    compLog = open(COMPILE_LOG_FILE_NAME, "w")
     cmd = ["gcc", "-Wall", "%s.c" % A1_PROG]
     if os.path.isfile("companion.c"):
         cmd.append("companion.c")
     cmd += ["-o", A1_PROG]
-    subprocess.call(cmd, stdout=compLog, stderr=compLog)
-    compLog.close()
+    key = buildKey(cmd)
+    if not restoreBuild(key, A1_PROG):
+        compLog = open(COMPILE_LOG_FILE_NAME, "w")
+        subprocess.call(cmd, stdout=compLog, stderr=compLog)
+        compLog.close()
+        storeBuild(key, A1_PROG)
     if os.path.isfile(A1_PROG):
         compLog = open(COMPILE_LOG_FILE_NAME)
         logContent = compLog.read()
@@ -724,6 +1269,198 @@ def compile():
     else:
         return 0
 
+COMPILER_VERSION = None
+
+def getCompilerVersion():
+    global COMPILER_VERSION
+    if COMPILER_VERSION is None:
+        try:
+            COMPILER_VERSION = subprocess.run(["gcc", "--version"], stdout=subprocess.PIPE,
+                                                stderr=subprocess.DEVNULL).stdout.decode(errors="ignore")
+        except OSError:
+            COMPILER_VERSION = ""
+    return COMPILER_VERSION
+
+# the key covers the command, the compiler version, the sources and all the headers
+# of the current directory; None if a source is missing
+def buildKey(cmd):
+    sources = [arg for arg in cmd if arg.endswith(".c")] + sorted(f for f in os.listdir(".") if f.endswith(".h"))
+    h = hashlib.sha256(json.dumps({"cmd": cmd, "compiler": getCompilerVersion()}).encode())
+    for src in sources:
+        try:
+            fin = open(src, "rb")
+        except OSError:
+            return None
+        h.update(b"\0%s\0" % src.encode())
+        h.update(fin.read())
+        fin.close()
+    return h.hexdigest()
+
+def buildCacheDir():
+    if not CACHE_DIR:
+        return None
+    return os.path.join(CACHE_DIR, "a1_builds")
+
+# a cached build has the compile log and, if the compilation succeeded, the binary
+def restoreBuild(key, prog):
+    cacheDir = buildCacheDir()
+    if cacheDir is None or key is None:
+        return False
+    entry = os.path.join(cacheDir, key)
+    if not os.path.isfile(os.path.join(entry, COMPILE_LOG_FILE_NAME)):
+        return False
+    try:
+        shutil.copy(os.path.join(entry, COMPILE_LOG_FILE_NAME), COMPILE_LOG_FILE_NAME)
+        if os.path.isfile(os.path.join(entry, prog)):
+            shutil.copy2(os.path.join(entry, prog), prog)
+        os.utime(entry)
+    except OSError:
+        # the entry was evicted by another tester in the meantime
+        return False
+    return True
+
+def storeBuild(key, prog):
+    cacheDir = buildCacheDir()
+    if cacheDir is None or key is None:
+        return
+    entry = os.path.join(cacheDir, key)
+    if os.path.isdir(entry):
+        return
+    tmpEntry = None
+    try:
+        os.makedirs(cacheDir, exist_ok=True)
+        tmpEntry = tempfile.mkdtemp(prefix="%s.tmp" % key, dir=cacheDir)
+        shutil.copy(COMPILE_LOG_FILE_NAME, tmpEntry)
+        if os.path.isfile(prog):
+            shutil.copy2(prog, tmpEntry)
+        try:
+            os.rename(tmpEntry, entry)
+            tmpEntry = None
+        except OSError:
+            # another tester stored the same build in the meantime
+            pass
+        evictCache(cacheDir, BUILD_CACHE_MAX_SIZE)
+    except OSError as e:
+        print("Could not save the build in the cache: %s" % e)
+    if tmpEntry is not None:
+        shutil.rmtree(tmpEntry, ignore_errors=True)
+
+# the key also covers the source of the tester, so that a change to the generation code
+# or to the reference solution never restores the fixtures made by the old code
+def fixtureKey(data):
+    with open(os.path.abspath(__file__), "rb") as fin:
+        source = hashlib.sha256(fin.read()).hexdigest()
+    key = {"data": data, "generator": GENERATOR_VERSION, "tester": source}
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+def fixtureCacheDir():
+    if not CACHE_DIR:
+        return None
+    return os.path.join(CACHE_DIR, "a1_fixtures")
+
+# the fixtures are copied both ways, never hard-linked: a solution that writes to
+# a fixture file must not change the cached one
+def restoreFixtures(key):
+    cacheDir = fixtureCacheDir()
+    if cacheDir is None:
+        return None
+    entry = os.path.join(cacheDir, key)
+    if not os.path.isfile(os.path.join(entry, "tests.json")):
+        return None
+    if os.path.isdir("test_root"):
+        shutil.rmtree("test_root")
+    try:
+        shutil.copytree(os.path.join(entry, "test_root"), "test_root")
+        shutil.copy(os.path.join(entry, "tests.json"), "tests.json")
+        # the modification time of an entry is used for the LRU eviction
+        os.utime(entry)
+        fin = open("tests.json")
+        tests = json.load(fin)
+        fin.close()
+    except (OSError, ValueError) as e:
+        # a broken or concurrently evicted entry; the fixtures are generated again and stored
+        print("Could not restore the test fixtures from the cache: %s" % e)
+        removeCacheEntry(entry)
+        shutil.rmtree("test_root", ignore_errors=True)
+        if os.path.isfile("tests.json"):
+            os.remove("tests.json")
+        return None
+    return tests
+
+def storeFixtures(key):
+    cacheDir = fixtureCacheDir()
+    if cacheDir is None:
+        return
+    entry = os.path.join(cacheDir, key)
+    if os.path.isdir(entry):
+        return
+    tmpEntry = None
+    try:
+        os.makedirs(cacheDir, exist_ok=True)
+        tmpEntry = tempfile.mkdtemp(prefix="%s.tmp" % key, dir=cacheDir)
+        shutil.copytree("test_root", os.path.join(tmpEntry, "test_root"))
+        shutil.copy("tests.json", os.path.join(tmpEntry, "tests.json"))
+        try:
+            os.rename(tmpEntry, entry)
+            tmpEntry = None
+        except OSError:
+            # another tester stored the same fixtures in the meantime
+            pass
+        evictCache(cacheDir, FIXTURE_CACHE_MAX_SIZE)
+    except OSError as e:
+        print("Could not save the test fixtures in the cache: %s" % e)
+    if tmpEntry is not None:
+        shutil.rmtree(tmpEntry, ignore_errors=True)
+
+# files removed by another tester while the tree is walked are not counted
+def getTreeSize(path):
+    size = 0
+    for root, _dirs, files in os.walk(path):
+        for name in files:
+            try:
+                size += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return size
+
+# staging directories older than this were left by a tester that died while storing an entry
+STALE_TMP_AGE = 3600
+
+# several testers may share the cache, so an entry is renamed to a staging name before it is
+# removed, and a restore sees either the whole entry or none of it
+def removeCacheEntry(entry):
+    tmpEntry = "%s.tmp%s" % (entry, os.urandom(8).hex())
+    try:
+        os.rename(entry, tmpEntry)
+    except OSError:
+        # another tester removed it first
+        return
+    shutil.rmtree(tmpEntry, ignore_errors=True)
+
+# the entries that disappear while the cache is scanned are skipped
+def evictCache(cacheDir, maxSize):
+    entries = []
+    now = time.time()
+    for name in os.listdir(cacheDir):
+        entry = os.path.join(cacheDir, name)
+        try:
+            mtime = os.path.getmtime(entry)
+            if not os.path.isdir(entry):
+                continue
+            if ".tmp" in name:
+                if now - mtime > STALE_TMP_AGE:
+                    shutil.rmtree(entry, ignore_errors=True)
+                continue
+            entries.append((mtime, getTreeSize(entry), entry))
+        except OSError:
+            continue
+    entries.sort(reverse=True)
+    total = 0
+    for _mtime, size, entry in entries:
+        total += size
+        if total > maxSize:
+            removeCacheEntry(entry)
+
 def loadTests():
     if os.path.isfile("tests.json"):
         fin = open("tests.json")
@@ -735,9 +1472,13 @@ def loadTests():
             decoded_data = base64.b64decode(content).decode('utf-8')
             data = json.loads(decoded_data)
 
-        print("Running tester for the first time.")
-        print("Generating tests cases (this may take a while)...")
-        tests = generateTests(data)
+        key = fixtureKey(data)
+        tests = restoreFixtures(key)
+        if tests is None:
+            print("Running tester for the first time.")
+            print("Generating tests cases (this may take a while)...")
+            tests = generateTests(data)
+            storeFixtures(key)
     return tests
 
 def checkValgrind():
@@ -786,22 +1527,85 @@ class DockerHelper:
         return res.output.decode("utf-8", "ignore")
 
     def copyCompileLogFileInCurrentDirectory(self):
-        stream, _stat = self.container.get_archive(posixpath.join(DockerHelper._WORKING_DIR, COMPILE_LOG_FILE_NAME))
+        self.copyFileInCurrentDirectory(COMPILE_LOG_FILE_NAME)
+
+    # returns False if the file does not exist in the container
+    def copyFileInCurrentDirectory(self, fname):
+        try:
+            stream, _stat = self.container.get_archive(posixpath.join(DockerHelper._WORKING_DIR, fname))
+        except docker.errors.NotFound:
+            return False
         file_obj = io.BytesIO()
         for c in stream:
             file_obj.write(c)
         file_obj.seek(0)
         tar = tarfile.open(mode="r", fileobj=file_obj)
         tar.extractall(".")
+        return True
+
+def saveResults(compileRes, score, maxScore, result, testResults):
+    with open(RESULTS_FILE_NAME, "w") as fout:
+        json.dump({"compile": compileRes, "score": score, "max_score": maxScore, "grade": result,
+                    "tests": testResults}, fout, indent=4)
+
+def grade(tests, compileRes, jobs=1):
+    if compileRes == 0:
+        print("COMPILATION ERROR")
+        saveResults(compileRes, 0, 0, 0.0, [])
+        return 0, 0, 0.0
+    Tester.leaks = False
+    score, testResults = runTests(tests, jobs)
+    maxScore = len(tests)
+    print("Total score: %d / %d" % (score, maxScore))
+    result = 100.0 * score / maxScore
+    if compileRes == 1:
+        print("\033[1;31mThere were some compilation warnings. A 10% penalty will be applied.\033[0m")
+        result = result * 0.9
+    if Tester.leaks:
+        print("\033[1;31mThere were some memory leaks. A 10% penalty will be applied.\033[0m")
+        result = result * 0.9
+    print("Assignment grade: %.2f / 100" % result)
+    saveResults(compileRes, score, maxScore, result, testResults)
+    return score, maxScore, result
+
+def parseIntOption(args, name, default):
+    value = default
+    if name in args:
+        i = args.index(name)
+        try:
+            value = int(args[i+1])
+        except (IndexError, ValueError):
+            print("\033[1;31mUsage: %s N\033[0m" % name)
+            sys.exit()
+        del args[i:i+2]
+    return value
+
+# "--generator N" selects the version of the random generator, see GENERATOR_VERSION
+def parseGenerator(args):
+    version = parseIntOption(args, "--generator", GENERATOR_VERSION)
+    if version not in (1, 2):
+        print("\033[1;31mUsage: --generator 1|2\033[0m")
+        sys.exit()
+    return version
+
+# "--jobs N" runs N tests at the same time; N = 0 uses all the CPUs
+def parseJobs(args):
+    jobs = parseIntOption(args, "--jobs", 1)
+    if jobs <= 0:
+        jobs = os.cpu_count() or 1
+    return jobs
 
 def main():
-    global VALGRIND
+    global VALGRIND, GENERATOR_VERSION
     args = sys.argv[1:]
     if "docker" in args:
         if not DOCKER_AVAILABLE:
             print("\033[1;31mPlease install the docker module for Python")
             sys.exit()
         args.remove("docker")
+        # a results file left by an earlier run must not pass for the results of this one
+        if os.path.isfile(RESULTS_FILE_NAME):
+            os.remove(RESULTS_FILE_NAME)
         dh = DockerHelper()
         dh.runContainer()
         dh.copyDir(".")
@@ -810,33 +1614,20 @@ def main():
         logFile.write(res)
         logFile.close()
         dh.copyCompileLogFileInCurrentDirectory()
+        if not dh.copyFileInCurrentDirectory(RESULTS_FILE_NAME):
+            print("\033[1;31mThe tests did not write %s.\033[0m" % RESULTS_FILE_NAME)
         dh.removeContainer()
         print(res)
     else:
         if "valgrind" in args:
             VALGRIND = True
             checkValgrind()
+        jobs = parseJobs(args)
+        GENERATOR_VERSION = parseGenerator(args)
         tests = loadTests()
 
         compileRes = compile()
-        if compileRes == 0:
-            print("COMPILATION ERROR")
-        else:
-            score = 0
-            maxScore = 0
-            for t in tests:
-                tester = Tester(t[0], t[1], t[2], t[3], t[4])
-                score += tester.perform()
-                maxScore += 1
-            print("Total score: %d / %d" % (score, maxScore))
-            score = 100.0 * score / maxScore
-            if compileRes == 1:
-                print("\033[1;31mThere were some compilation warnings. A 10% penalty will be applied.\033[0m")
-                score = score * 0.9
-            if Tester.leaks:
-                print("\033[1;31mThere were some memory leaks. A 10% penalty will be applied.\033[0m")
-                score = score * 0.9
-            print("Assignment grade: %.2f / 100" % score)
+        grade(tests, compileRes, jobs)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
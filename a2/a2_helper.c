@@ -5,6 +5,7 @@
 #include <sys/types.h> 
 #include <sys/socket.h>
 #include <netinet/in.h>
+#include <sys/un.h>
 #include <semaphore.h>
 #include <sys/stat.h>
 #include <fcntl.h>
@@ -21,13 +22,60 @@
 #define STR(s) #s
 #define CHECK(c) if(!(c)){perror("info function failed at line " XSTR(__LINE__)); break;}
 
+#define PROTOCOL_ENV "A2_HELPER_PROTOCOL"
+#define SOCKET_ENV "A2_HELPER_SOCKET"
+#define PORT_ENV "A2_HELPER_PORT"
+#define SEM_ENV "A2_HELPER_SEM"
+
 int initialized = 0;
+// in the "persistent" protocol each process sends all its messages over one connection
+int persistent = 0;
+int serverFd = -1;
+
+// when set, the messages go to this unix domain socket instead of the TCP port
+char *serverPath = NULL;
+// the tester may choose its own port and semaphore, to run several graders at once
+int serverPort = SERVER_PORT;
+char *semName = SEM_NAME;
+
+int createSocket(){
+    return socket(serverPath != NULL ? AF_UNIX : AF_INET, SOCK_STREAM, 0);
+}
+
+int connectSocket(int sockfd){
+    struct sockaddr_in serv_addr;
+    struct sockaddr_un serv_addr_un;
+
+    if(serverPath != NULL){
+        memset(&serv_addr_un, 0, sizeof(serv_addr_un));
+        serv_addr_un.sun_family = AF_UNIX;
+        strncpy(serv_addr_un.sun_path, serverPath, sizeof(serv_addr_un.sun_path) - 1);
+        return connect(sockfd, (struct sockaddr*)&serv_addr_un, sizeof(serv_addr_un));
+    }
+    memset(&serv_addr, 0, sizeof(serv_addr));
+    serv_addr.sin_family = AF_INET;
+    serv_addr.sin_port = htons(serverPort);
+    return connect(sockfd, (struct sockaddr*)&serv_addr, sizeof(serv_addr));
+}
+
+int connectServer(){
+    int sockfd;
+
+    if((sockfd = createSocket()) < 0){
+        return -1;
+    }
+    if(connectSocket(sockfd) < 0){
+        close(sockfd);
+        return -1;
+    }
+    return sockfd;
+}
 
 int info(int action, int processNr, int threadNr){
     int msg[6];
     int sleepTime = 0;
     int sockfd = -1;
-    struct sockaddr_in serv_addr;
+    int connected = 0;
     sem_t *sem = SEM_FAILED;
     int err = -1;
 
@@ -36,7 +84,7 @@ int info(int action, int processNr, int threadNr){
         return -1;
     }
     do{
-        CHECK((sem = sem_open(SEM_NAME, 0)) != SEM_FAILED);
+        CHECK((sem = sem_open(semName, 0)) != SEM_FAILED);
 
         //prepare the message
         msg[0] = action;
@@ -46,15 +94,24 @@ int info(int action, int processNr, int threadNr){
         msg[4] = getppid();
         msg[5] = (int)(long)pthread_self();
 
-        CHECK((sockfd = socket(AF_INET, SOCK_STREAM, 0)) >= 0);
-        
-        memset(&serv_addr, 0, sizeof(serv_addr));
-        serv_addr.sin_family = AF_INET;
-        serv_addr.sin_port = htons(SERVER_PORT);
+        if(!persistent){
+            CHECK((sockfd = createSocket()) >= 0);
+        }
 
         CHECK(sem_wait(sem) == 0);
         err = -2;
-        if(connect(sockfd, (struct sockaddr*)&serv_addr, sizeof(serv_addr)) >= 0){
+        if(persistent){
+            if(serverFd < 0){
+                serverFd = connectServer();
+            }
+            connected = (serverFd >= 0);
+        }else{
+            connected = (connectSocket(sockfd) >= 0);
+        }
+        if(connected){
+            if(persistent){
+                sockfd = serverFd;
+            }
             CHECK(write(sockfd, msg, sizeof(msg)) == sizeof(msg));
             CHECK(read(sockfd, &sleepTime, sizeof(sleepTime)) == sizeof(sleepTime));
             printf("[T] ");
@@ -67,7 +124,13 @@ int info(int action, int processNr, int threadNr){
         usleep(sleepTime);
         err = 0;
     }while(0);
-    if(sockfd >= 0){
+    if(persistent){
+        if(err == -2 && serverFd >= 0){
+            // the connection is broken, the next message will open a new one
+            close(serverFd);
+            serverFd = -1;
+        }
+    }else if(sockfd >= 0){
         close(sockfd);
     }
     if(err==-2){
@@ -79,7 +142,7 @@ int info(int action, int processNr, int threadNr){
 void atfork_prepare(){
     sem_t *sem = SEM_FAILED;
     do{
-        CHECK((sem = sem_open(SEM_NAME, O_CREAT, 0644, 1)) != SEM_FAILED);
+        CHECK((sem = sem_open(semName, O_CREAT, 0644, 1)) != SEM_FAILED);
         CHECK(sem_wait(sem) == 0);
     }while(0);
 }
@@ -87,25 +150,41 @@ void atfork_prepare(){
 void atfork_parent(){
     sem_t *sem = SEM_FAILED;
     do{
-        CHECK((sem = sem_open(SEM_NAME, O_CREAT, 0644, 1)) != SEM_FAILED);
+        CHECK((sem = sem_open(semName, O_CREAT, 0644, 1)) != SEM_FAILED);
         CHECK(sem_post(sem) == 0);
     }while(0);
 }
 
 void atfork_child(){
     prctl(PR_SET_PDEATHSIG, SIGHUP);
+    // the child opens its own connection
+    if(serverFd >= 0){
+        close(serverFd);
+        serverFd = -1;
+    }
 }
 
 void init(){
     sem_t *sem = SEM_FAILED;
+    char *protocol = NULL;
+    char *value = NULL;
     if(initialized != 0){
         printf("init() function already called\n");
         return;
     }
     do{
+        protocol = getenv(PROTOCOL_ENV);
+        persistent = (protocol != NULL && strcmp(protocol, "persistent") == 0);
+        serverPath = getenv(SOCKET_ENV);
+        if((value = getenv(PORT_ENV)) != NULL){
+            serverPort = atoi(value);
+        }
+        if((value = getenv(SEM_ENV)) != NULL){
+            semName = value;
+        }
         pthread_atfork(atfork_prepare, atfork_parent, atfork_child);
-        sem_unlink(SEM_NAME);
-        CHECK((sem = sem_open(SEM_NAME, O_CREAT, 0644, 1)) != SEM_FAILED);
+        sem_unlink(semName);
+        CHECK((sem = sem_open(semName, O_CREAT, 0644, 1)) != SEM_FAILED);
         initialized = 1;
     }while(0);
 }
@@ -1,16 +1,33 @@
 #!/usr/bin/env python3
-import re, os, sys, socket, struct, subprocess, json, base64
-import threading, ctypes, ctypes.util, tarfile, io, posixpath
+import re, os, sys, socket, struct, subprocess, json, base64, selectors, signal, time
+import threading, ctypes, ctypes.util, tarfile, io, posixpath, tempfile, shutil, itertools
+import random, contextlib, concurrent.futures, hashlib
 import argparse
 
 A2_PROG = "a2"
+# defaults of a2_helper; every Server uses its own free port and semaphore name,
+# so that many graders can run at the same time on the same host
 SEM_NAME = "A2_HELPER_SEM_17871"
 SERVER_PORT = 1988
+# "connection" opens a connection for every info() message,
+# "persistent" keeps one connection for each process
+PROTOCOL = "connection"
+# "tcp" uses a free localhost port, "unix" a unix domain socket in a temporary directory
+TRANSPORT = "tcp"
 
 VERBOSE = False
 TIME_LIMIT = 3
 
 COMPILE_LOG_FILE_NAME = "compile_log.txt"
+RESULTS_FILE_NAME = "results.json"
+HELPER_LOG_FILE_NAME = "helper_compile_log.txt"
+HELPER_SOURCES = ["%s_helper.c" % A2_PROG, "%s_helper.h" % A2_PROG]
+HELPER_OBJ = "%s_helper.o" % A2_PROG
+HELPER_KEY_FILE_NAME = "%s_helper.o.key" % A2_PROG
+
+# compiled submissions are cached here; set OS_TESTER_CACHE="" to disable
+CACHE_DIR = os.environ.get("OS_TESTER_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "os-tester"))
+BUILD_CACHE_MAX_SIZE = 256 * 1024 * 1024
 
 try:
     import docker
@@ -22,10 +39,16 @@ def compile():
     if os.path.isfile(A2_PROG):
         os.remove(A2_PROG)
     LOG_FILE = "compile_log.txt"
-    compLog = open(LOG_FILE, "w")
-    subprocess.call(["gcc", "-Wall", "%s.c" % A2_PROG, "%s_helper.c" % A2_PROG, "-o", A2_PROG, "-pthread", "-lrt"], 
-                        stdout=compLog, stderr=compLog)
-    compLog.close()
+    if buildHelper():
+        cmd = ["gcc", "-Wall", "%s.c" % A2_PROG, HELPER_OBJ, "-o", A2_PROG, "-pthread", "-lrt"]
+    else:
+        cmd = ["gcc", "-Wall", "%s.c" % A2_PROG, "%s_helper.c" % A2_PROG, "-o", A2_PROG, "-pthread", "-lrt"]
+    key = buildKey(cmd)
+    if not restoreBuild(key, A2_PROG):
+        compLog = open(LOG_FILE, "w")
+        subprocess.call(cmd, stdout=compLog, stderr=compLog)
+        compLog.close()
+        storeBuild(key, A2_PROG)
     if os.path.isfile(A2_PROG):
         compLog = open(LOG_FILE)
         logContent = compLog.read()
@@ -36,6 +59,165 @@ def compile():
     else:
         return 0
 
+# a2_helper.c is the same for all the submissions, so its object is reused while the stamp
+# saved next to it matches the build key of the helper sources and the object itself,
+# or restored from the build cache; the helper warnings go to their own log and are not penalized
+def buildHelper():
+    cmd = ["gcc", "-Wall", "-c", HELPER_SOURCES[0], "-o", HELPER_OBJ, "-pthread"]
+    key = buildKey(cmd)
+    if key is not None and os.path.isfile(HELPER_OBJ) and readHelperKey() == helperStamp(key):
+        return True
+    for fname in (HELPER_OBJ, HELPER_KEY_FILE_NAME):
+        if os.path.isfile(fname):
+            os.remove(fname)
+    if not restoreBuild(key, HELPER_OBJ, HELPER_LOG_FILE_NAME):
+        compLog = open(HELPER_LOG_FILE_NAME, "w")
+        subprocess.call(cmd, stdout=compLog, stderr=compLog)
+        compLog.close()
+        storeBuild(key, HELPER_OBJ, HELPER_LOG_FILE_NAME)
+    if key is not None and os.path.isfile(HELPER_OBJ):
+        with open(HELPER_KEY_FILE_NAME, "w") as fout:
+            fout.write(helperStamp(key))
+    return os.path.isfile(HELPER_OBJ)
+
+def helperStamp(key):
+    with open(HELPER_OBJ, "rb") as fin:
+        return "%s %s" % (key, hashlib.sha256(fin.read()).hexdigest())
+
+def readHelperKey():
+    try:
+        with open(HELPER_KEY_FILE_NAME) as fin:
+            return fin.read().strip()
+    except OSError:
+        return None
+
+COMPILER_VERSION = None
+
+def getCompilerVersion():
+    global COMPILER_VERSION
+    if COMPILER_VERSION is None:
+        try:
+            COMPILER_VERSION = subprocess.run(["gcc", "--version"], stdout=subprocess.PIPE,
+                                                stderr=subprocess.DEVNULL).stdout.decode(errors="ignore")
+        except OSError:
+            COMPILER_VERSION = ""
+    return COMPILER_VERSION
+
+# the key covers the command, the compiler version, the sources, objects and all the headers
+# of the current directory; None if a source is missing
+def buildKey(cmd):
+    outputs = [cmd[i + 1] for i in range(len(cmd) - 1) if cmd[i] == "-o"]
+    sources = [arg for arg in cmd if arg.endswith((".c", ".o")) and arg not in outputs]
+    sources += sorted(f for f in os.listdir(".") if f.endswith(".h"))
+    h = hashlib.sha256(json.dumps({"cmd": cmd, "compiler": getCompilerVersion()}).encode())
+    for src in sources:
+        try:
+            fin = open(src, "rb")
+        except OSError:
+            return None
+        h.update(b"\0%s\0" % src.encode())
+        h.update(fin.read())
+        fin.close()
+    return h.hexdigest()
+
+def buildCacheDir():
+    if not CACHE_DIR:
+        return None
+    return os.path.join(CACHE_DIR, "a2_builds")
+
+# a cached build has the compile log and, if the compilation succeeded, the binary
+def restoreBuild(key, prog, logFile=COMPILE_LOG_FILE_NAME):
+    cacheDir = buildCacheDir()
+    if cacheDir is None or key is None:
+        return False
+    entry = os.path.join(cacheDir, key)
+    if not os.path.isfile(os.path.join(entry, logFile)):
+        return False
+    try:
+        shutil.copy(os.path.join(entry, logFile), logFile)
+        if os.path.isfile(os.path.join(entry, prog)):
+            shutil.copy2(os.path.join(entry, prog), prog)
+        os.utime(entry)
+    except OSError:
+        # the entry was evicted by another tester in the meantime
+        return False
+    return True
+
+def storeBuild(key, prog, logFile=COMPILE_LOG_FILE_NAME):
+    cacheDir = buildCacheDir()
+    if cacheDir is None or key is None:
+        return
+    entry = os.path.join(cacheDir, key)
+    if os.path.isdir(entry):
+        return
+    tmpEntry = None
+    try:
+        os.makedirs(cacheDir, exist_ok=True)
+        tmpEntry = tempfile.mkdtemp(prefix="%s.tmp" % key, dir=cacheDir)
+        shutil.copy(logFile, tmpEntry)
+        if os.path.isfile(prog):
+            shutil.copy2(prog, tmpEntry)
+        try:
+            os.rename(tmpEntry, entry)
+            tmpEntry = None
+        except OSError:
+            # another tester stored the same build in the meantime
+            pass
+        evictCache(cacheDir, BUILD_CACHE_MAX_SIZE)
+    except OSError as e:
+        print("Could not save the build in the cache: %s" % e)
+    if tmpEntry is not None:
+        shutil.rmtree(tmpEntry, ignore_errors=True)
+
+# files removed by another tester while the tree is walked are not counted
+def getTreeSize(path):
+    size = 0
+    for root, _dirs, files in os.walk(path):
+        for name in files:
+            try:
+                size += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return size
+
+# staging directories older than this were left by a tester that died while storing an entry
+STALE_TMP_AGE = 3600
+
+# several testers may share the cache, so an entry is renamed to a staging name before it is
+# removed, and a restore sees either the whole entry or none of it
+def removeCacheEntry(entry):
+    tmpEntry = "%s.tmp%s" % (entry, os.urandom(8).hex())
+    try:
+        os.rename(entry, tmpEntry)
+    except OSError:
+        # another tester removed it first
+        return
+    shutil.rmtree(tmpEntry, ignore_errors=True)
+
+# the entries that disappear while the cache is scanned are skipped
+def evictCache(cacheDir, maxSize):
+    entries = []
+    now = time.time()
+    for name in os.listdir(cacheDir):
+        entry = os.path.join(cacheDir, name)
+        try:
+            mtime = os.path.getmtime(entry)
+            if not os.path.isdir(entry):
+                continue
+            if ".tmp" in name:
+                if now - mtime > STALE_TMP_AGE:
+                    shutil.rmtree(entry, ignore_errors=True)
+                continue
+            entries.append((mtime, getTreeSize(entry), entry))
+        except OSError:
+            continue
+    entries.sort(reverse=True)
+    total = 0
+    for _mtime, size, entry in entries:
+        total += size
+        if total > maxSize:
+            removeCacheEntry(entry)
+
 class Info:
     BEGIN = 1
     END = 2
@@ -54,15 +236,36 @@ class Info:
                     self.pid, self.ppid, self.tid, self.timeStart, self.timeEnd)
 
 
+# Single-threaded server that multiplexes all the client sockets with a selector,
+# so bursts of connections are accepted right away, while the messages are still
+# passed to addInfo() one at a time, in the order they are completed.
 class Server(threading.Thread):
+    MSG_SIZE = 6 * 4
+    ids = itertools.count(1)
+
     def __init__(self):
         threading.Thread.__init__(self)
         self.reset()
         self.shouldStop = False
-        self.servSocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.servSocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.servSocket.bind(("localhost", SERVER_PORT))
-        self.servSocket.listen(5)
+        self.semName = "%s_%d_%d" % (SEM_NAME, os.getpid(), next(Server.ids))
+        self.port = None
+        if TRANSPORT == "unix":
+            self.socketPath = os.path.join(tempfile.mkdtemp(prefix="a2_tester_"), "server.sock")
+            self.servSocket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.servSocket.bind(self.socketPath)
+        else:
+            self.socketPath = None
+            self.servSocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.servSocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.servSocket.bind(("localhost", 0))
+            self.port = self.servSocket.getsockname()[1]
+        self.servSocket.listen(socket.SOMAXCONN)
+        self.servSocket.setblocking(False)
+        self.wakeSocket, self.stopSocket = socket.socketpair()
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.servSocket, selectors.EVENT_READ)
+        self.selector.register(self.wakeSocket, selectors.EVENT_READ)
+        self.buffers = {}
 
     def reset(self):
         self.time = 0
@@ -70,6 +273,15 @@ class Server(threading.Thread):
         self.errors = []
         self.delays = {}
 
+    # the environment that tells a2_helper how to reach this server
+    def helperEnv(self):
+        env = {"A2_HELPER_PROTOCOL": PROTOCOL, "A2_HELPER_SEM": self.semName}
+        if self.port is not None:
+            env["A2_HELPER_PORT"] = str(self.port)
+        if self.socketPath is not None:
+            env["A2_HELPER_SOCKET"] = self.socketPath
+        return env
+
     def addInfo(self, msg):
         i = Info(msg)
         key = (i.proc, i.th)
@@ -100,36 +312,76 @@ class Server(threading.Thread):
             return self.delays[key]
         return 0
 
-
-    def run(self):
+    def acceptClients(self):
         while True:
-            (clientSocket, _address) = self.servSocket.accept()
-            if self.shouldStop:
-                self.servSocket.close()
-                break
-            msg_size_remaining = 6 * 4
-            msg = bytes()
-            while msg_size_remaining != 0:
-                current_buffer = clientSocket.recv(msg_size_remaining)
-                if len(current_buffer) == 0:
-                    break
-                msg += current_buffer
-                msg_size_remaining -= len(current_buffer)
-            if len(msg) == 6 * 4:
-                msg = struct.unpack("i"*6, msg)
-                delay = self.addInfo(msg)
-            else:
-                delay = -10
+            try:
+                (clientSocket, _address) = self.servSocket.accept()
+            except BlockingIOError:
+                return
+            clientSocket.setblocking(False)
+            self.buffers[clientSocket] = b""
+            self.selector.register(clientSocket, selectors.EVENT_READ)
+
+    def closeClient(self, clientSocket):
+        self.selector.unregister(clientSocket)
+        del self.buffers[clientSocket]
+        clientSocket.close()
+
+    def reply(self, clientSocket, delay):
+        try:
             if delay < 0:
                 # there was an error, we will stop the test
                 clientSocket.sendall(struct.pack("i", 0))
             else:
                 clientSocket.sendall(struct.pack("i", delay))
+        except OSError:
+            self.closeClient(clientSocket)
+
+    def readClient(self, clientSocket):
+        msg = self.buffers[clientSocket]
+        try:
+            current_buffer = clientSocket.recv(Server.MSG_SIZE - len(msg))
+        except BlockingIOError:
+            return
+        except OSError:
+            current_buffer = b""
+        if len(current_buffer) == 0:
+            if len(msg) != 0:
+                # incomplete message
+                self.reply(clientSocket, -10)
+            if clientSocket in self.buffers:
+                self.closeClient(clientSocket)
+            return
+        msg += current_buffer
+        if len(msg) < Server.MSG_SIZE:
+            self.buffers[clientSocket] = msg
+            return
+        # the connection stays open for the next message, until the client closes it
+        self.buffers[clientSocket] = b""
+        delay = self.addInfo(struct.unpack("i"*6, msg))
+        self.reply(clientSocket, delay)
+
+    def run(self):
+        while not self.shouldStop:
+            for key, _events in self.selector.select():
+                if key.fileobj is self.servSocket:
+                    self.acceptClients()
+                elif key.fileobj is self.wakeSocket:
+                    self.shouldStop = True
+                elif key.fileobj in self.buffers:
+                    self.readClient(key.fileobj)
+        for clientSocket in list(self.buffers):
+            self.closeClient(clientSocket)
+        self.selector.close()
+        self.servSocket.close()
+        self.wakeSocket.close()
+        self.stopSocket.close()
+        if self.socketPath is not None:
+            shutil.rmtree(os.path.dirname(self.socketPath), ignore_errors=True)
 
     def stop(self):
-        self.shouldStop = True
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.connect(("localhost", SERVER_PORT))
+        self.stopSocket.send(b"\0")
+        self.join()
 
 def checkProcessHierarchy(data, infos):
     errors = []
@@ -220,6 +472,9 @@ def checkThreads1(data, infos):
         score = 5
     return errors, score
 
+def runningThreads(thInfos, t):
+    return [info.th for info in thInfos.values() if info.timeStart <= t <= info.timeEnd]
+
 def checkThreads2(data, infos):
     score = 0
     errors = []
@@ -257,22 +512,24 @@ def checkThreads2(data, infos):
         return errors, score
     score += 1
 
-    times = {}
+    # sweep over the start / end events to find the first moment with too many threads
+    events = []
     for info in thInfos.values():
-        for t in range(info.timeStart, info.timeEnd+1):
-            if t not in times:
-                times[t] = []
-            times[t].append(info.th)
+        events.append((info.timeStart, 1))
+        events.append((info.timeEnd + 1, -1))
+    events.sort()
+    running = 0
     violation = False
-    for t in sorted(times.keys()):
-        if len(times[t]) > maxThreads:
+    for t, delta in events:
+        running += delta
+        if running > maxThreads:
             errors.append("the following threads are running at the same time: %s" % 
-                                " ".join([str(th) for th in times[t]]))
+                                " ".join([str(th) for th in runningThreads(thInfos, t)]))
             violation = True
             break
     if not violation:
         score += 1
-    waiterGroup = times[thInfos[thWaiter].timeEnd]
+    waiterGroup = runningThreads(thInfos, thInfos[thWaiter].timeEnd)
     if len(waiterGroup) != maxThreads:
         errors.append("the following threads are running while ending thread T%d.%d: %s" % 
                                 (procNr, thWaiter, " ".join([str(th) for th in waiterGroup])))
@@ -338,7 +595,217 @@ def checkThreads3(data, infos):
     
     return errors, score
 
-class Tester(threading.Thread):
+def getDelays(nr, data):
+    delays = {}
+    # add delays for leaf processes
+    if nr in (2, 3, 4):
+        for p in data["procs"]:
+            if p not in data["procs"].values():
+                delays[(int(p), 0)] = nr * 40000
+    # add delays for "Synchronizing threads from the same process"
+    if nr in (2, 4):
+        p1 = int(data["threads1_proc"])
+        #to = int(data["threads1_outer"])
+        ti = int(data["threads1_inner"])
+        delays[(p1, ti)] = 100000 * nr
+    # add delays for "Synchronizing threads from different processes"
+    if nr in (3, 4):
+        p1 = int(data["threads1_proc"])
+        p3 = int(data["threads3_proc"])
+        tw = int(data["threads1_3"])
+        tb = int(data["threads3_before"])
+        #ta = int(data["threads3_after"])
+        delays[(p3, tb)] = 50000 * nr
+        delays[(p1, tw)] = 70000 * nr
+    # add delays for "Threads barrier"
+    if nr in (2, 3):
+        p2 = int(data["threads2_proc"])
+        p2_count = int(data["threads2_count"])
+        tw = int(data["threads2_waiter"])
+        if nr == 2:
+            delays[(p2, tw)] = 250000
+        elif nr == 3:
+            for t in range(1, p2_count+1):
+                if t != tw:
+                    delays[(p2, t)] = 10000
+    # add delays to enforce concurrency in "Threads barrier"
+    if nr == 5:
+        p2 = int(data["threads2_proc"])
+        p2_count = int(data["threads2_count"])
+        d = 2 * TIME_LIMIT * 1000000 // p2_count
+        for t in range(1, p2_count+1):
+            delays[(p2, t)] = d
+    return delays
+
+# delays of the synchronization scenarios that may be added to the other runs
+def getExtraDelays(data):
+    delays = {}
+    for nr in (2, 3, 4):
+        delays.update(getDelays(nr, data))
+    return delays
+
+# the process runner below is the same in the a1, a2 and a3 testers: every tester directory
+# is copied on its own into the grading container, so it cannot import a shared module;
+# a change to it must be made in all three copies
+
+# how often the processes are polled when the kernel has no pidfd support
+POLL_INTERVAL = 0.01
+
+# a test process supervised by runProcesses(); it runs in its own session,
+# so that it can be killed together with all the processes it creates
+class TestProcess:
+    def __init__(self, cmd, timeLimit, capture=False, quiet=True, env=None):
+        self.cmd = cmd
+        self.timeLimit = timeLimit
+        self.capture = capture
+        self.quiet = quiet
+        self.env = env
+        self.p = None
+        self.pidfd = None
+        self.streams = {}
+        self.output = []
+        self.err = []
+        self.startTime = None
+        self.deadline = None
+        self.elapsed = None
+        self.userTime = None
+        self.sysTime = None
+        self.timeout = False
+        self.exited = False
+
+    def start(self, selector):
+        if self.capture:
+            stdout = stderr = subprocess.PIPE
+        elif self.quiet:
+            stdout = stderr = subprocess.DEVNULL
+        else:
+            stdout = stderr = None
+        self.startTime = time.perf_counter()
+        self.deadline = self.startTime + self.timeLimit
+        try:
+            self.p = subprocess.Popen(self.cmd, stdout=stdout, stderr=stderr, env=self.env, start_new_session=True)
+        except OSError as e:
+            # a missing or broken binary counts as a test that produced no output
+            self.err.append(str(e).encode())
+            self.elapsed = 0
+            self.exited = True
+            return
+        if self.capture:
+            for stream, chunks in ((self.p.stdout, self.output), (self.p.stderr, self.err)):
+                os.set_blocking(stream.fileno(), False)
+                self.streams[stream] = chunks
+                selector.register(stream, selectors.EVENT_READ, self)
+        try:
+            self.pidfd = os.pidfd_open(self.p.pid)
+            selector.register(self.pidfd, selectors.EVENT_READ, self)
+        except (AttributeError, OSError):
+            self.pidfd = None
+
+    def handle(self, selector, fileobj):
+        if fileobj in self.streams:
+            self.readStream(selector, fileobj)
+        else:
+            self.checkExit(selector)
+
+    def readStream(self, selector, stream):
+        try:
+            chunk = os.read(stream.fileno(), 65536)
+        except BlockingIOError:
+            return
+        if chunk:
+            self.streams[stream].append(chunk)
+        else:
+            selector.unregister(stream)
+            del self.streams[stream]
+            stream.close()
+
+    def checkExit(self, selector):
+        if self.exited or os.waitid(os.P_PID, self.p.pid, os.WEXITED | os.WNOHANG | os.WNOWAIT) is None:
+            return
+        self.elapsed = time.perf_counter() - self.startTime
+        self.exited = True
+        # the process is not reaped yet, so its id still names the process group
+        # and the processes left behind can be killed safely
+        self.kill()
+        # the resource usage includes the children that the process waited for
+        _pid, status, usage = os.wait4(self.p.pid, 0)
+        self.p.returncode = os.waitstatus_to_exitcode(status)
+        self.userTime = usage.ru_utime
+        self.sysTime = usage.ru_stime
+        if self.pidfd is not None:
+            selector.unregister(self.pidfd)
+            os.close(self.pidfd)
+            self.pidfd = None
+
+    def kill(self):
+        if self.p is None or self.p.returncode is not None:
+            return
+        try:
+            os.killpg(self.p.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    def done(self):
+        return self.exited and len(self.streams) == 0
+
+    def getOutput(self):
+        return b"".join(self.output)
+
+    def getErrors(self):
+        return b"".join(self.err)
+
+# wall time and CPU times are in seconds; there is no peak RSS, since the kernel keeps the
+# peak RSS across exec and ru_maxrss would report the RSS of the tester at the time of the fork
+def getTestResult(name, score, maxScore, proc):
+    return {"name": name, "score": score, "max_score": maxScore, "timeout": proc.timeout,
+            "wall_time": proc.elapsed, "user_time": proc.userTime, "sys_time": proc.sysTime}
+
+# runs the processes from a single event loop, with at most jobs of them at the same time;
+# onStart is called right after each process is started
+def runProcesses(procs, jobs=1, onStart=None):
+    selector = selectors.DefaultSelector()
+    waiting = list(reversed(procs))
+    running = []
+    try:
+        while len(waiting) > 0 or len(running) > 0:
+            while len(waiting) > 0 and len(running) < jobs:
+                proc = waiting.pop()
+                proc.start(selector)
+                running.append(proc)
+                if onStart is not None:
+                    onStart(proc)
+            # a process that could not be started is already done and has nothing to wait for
+            running = [proc for proc in running if not proc.done()]
+            if len(running) == 0:
+                continue
+            timeout = None
+            deadlines = [proc.deadline for proc in running if not proc.exited and not proc.timeout]
+            if len(deadlines) > 0:
+                timeout = max(0, min(deadlines) - time.perf_counter())
+            if any(proc.pidfd is None and not proc.exited for proc in running):
+                timeout = POLL_INTERVAL if timeout is None else min(timeout, POLL_INTERVAL)
+            for key, _events in selector.select(timeout):
+                key.data.handle(selector, key.fileobj)
+            now = time.perf_counter()
+            for proc in running:
+                if proc.pidfd is None:
+                    proc.checkExit(selector)
+                if not proc.exited and not proc.timeout and now >= proc.deadline:
+                    proc.timeout = True
+                    proc.kill()
+            running = [proc for proc in running if not proc.done()]
+    finally:
+        for proc in running:
+            proc.kill()
+            for stream in proc.streams:
+                stream.close()
+            if proc.pidfd is not None:
+                os.close(proc.pidfd)
+            if proc.p is not None:
+                proc.p.wait()
+        selector.close()
+
+class Tester:
     CHECK_FUNCTIONS = [
                         (checkProcessHierarchy, "process hierarchy"),
                         (checkThreads1, "threads from the same process"),
@@ -347,85 +814,41 @@ class Tester(threading.Thread):
                     ]
     CHECK_MAX_SCORE = 5
 
-    def __init__(self, nr, server, data):
-        threading.Thread.__init__(self)
+    def __init__(self, nr, server, data, rng=None):
         print("\033[1;35mTest %d...\033[0m" % nr)
         self.server = server
         self.cmd = ["./%s" % A2_PROG]
         self.timeLimit = TIME_LIMIT
-        self.result = None
-        self.p = None
+        self.proc = None
         self.data = data
-        self.delays = {}
-
-        # add delays for leaf processes
-        if nr in (2, 3, 4):
-            for p in self.data["procs"]:
-                if p not in self.data["procs"].values():
-                    self.delays[(int(p), 0)] = nr * 40000
-        # add delays for "Synchronizing threads from the same process"
-        if nr in (2, 4):
-            p1 = int(self.data["threads1_proc"])
-            #to = int(self.data["threads1_outer"])
-            ti = int(self.data["threads1_inner"])
-            self.delays[(p1, ti)] = 100000 * nr
-        # add delays for "Synchronizing threads from different processes"
-        if nr in (3, 4):
-            p1 = int(self.data["threads1_proc"])
-            p3 = int(self.data["threads3_proc"])
-            tw = int(self.data["threads1_3"])
-            tb = int(self.data["threads3_before"])
-            #ta = int(self.data["threads3_after"])
-            self.delays[(p3, tb)] = 50000 * nr
-            self.delays[(p1, tw)] = 70000 * nr
-        # add delays for "Threads barrier"
-        if nr in (2, 3):
-            p2 = int(self.data["threads2_proc"])
-            p2_count = int(self.data["threads2_count"])
-            tw = int(self.data["threads2_waiter"])
-            if nr == 2:
-                self.delays[(p2, tw)] = 250000
-            elif nr == 3:
-                for t in range(1, p2_count+1):
-                    if t != tw:
-                        self.delays[(p2, t)] = 10000
-        # add delays to enforce concurrency in "Threads barrier"
-        if nr == 5:
-            p2 = int(self.data["threads2_proc"])
-            p2_count = int(self.data["threads2_count"])
-            d = 2 * TIME_LIMIT * 1000000 // p2_count
-            for t in range(1, p2_count+1):
-                self.delays[(p2, t)] = d
+        self.delays = getDelays(nr, data)
+        self.checkScores = [0] * len(Tester.CHECK_FUNCTIONS)
+        self.timedOut = False
+        if rng is not None:
+            # randomly delay some of the threads that the other scenarios delay
+            for key, delay in getExtraDelays(data).items():
+                if key not in self.delays and rng.random() < 0.25:
+                    self.delays[key] = int(delay * rng.uniform(0.1, 1.0))
 
-    def run(self):
+    def execute(self):
         self.server.reset()
         self.server.delays = self.delays
-        if VERBOSE:
-            self.p = subprocess.Popen(self.cmd)
-        else:
-            self.p = subprocess.Popen(self.cmd, stdout=open(os.devnull, "w"), stderr=open(os.devnull, "w"))
-        self.p.wait()
+        env = dict(os.environ, **self.server.helperEnv())
+        self.proc = TestProcess(self.cmd, self.timeLimit, quiet=not VERBOSE, env=env)
+        runProcesses([self.proc])
 
     def perform(self):
-        timeout = False
-        self.start()
-        self.join(self.timeLimit)
-
-        if self.is_alive():
-            if self.p is not None:
-                self.p.kill()
-                timeout = True
-            self.join()
-
-        if timeout:
+        self.execute()
+        if self.proc.timeout:
             print("\t\033[1;31mTIME LIMIT EXCEEDED\033[0m")
+            self.timedOut = True
             return 0, Tester.CHECK_MAX_SCORE * len(Tester.CHECK_FUNCTIONS)
 
         score = 0
         for err in self.server.errors:
             print("\t%s" % err)
         if len(self.server.errors) == 0:
-            for checkFn, checkName in Tester.CHECK_FUNCTIONS:
+            for i, (checkFn, checkName) in enumerate(Tester.CHECK_FUNCTIONS):
                 print("\tChecking %s..." % checkName)
                 errors, testScore = checkFn(self.data, self.server.infos)
                 for err in errors:
@@ -437,16 +860,112 @@ class Tester(threading.Thread):
                 else:
                     print("\t\t\033[1;31mFAIL           \033[0m", end="")
                 print(" [%d point(s)]" % testScore)
+                self.checkScores[i] = testScore
                 score += testScore
 
         return score, Tester.CHECK_MAX_SCORE * len(Tester.CHECK_FUNCTIONS)
 
-def resetSemaphore():
+def resetSemaphore(semName=SEM_NAME):
     O_CREAT = 0x0200
     _lib = ctypes.CDLL(ctypes.util.find_library("pthread"))
     _sem_unlink = _lib.sem_unlink
     _sem_unlink.argtypes = (ctypes.c_char_p, )
-    _sem_unlink(SEM_NAME.encode())
+    _sem_unlink(semName.encode())
+
+def loadData():
+    with open("a2_data.json") as a2_data:
+        content = a2_data.read()
+        decoded_data = base64.b64decode(content).decode("utf-8")
+        return json.loads(decoded_data)
+
+def saveResults(compileRes, score, maxScore, result, testResults):
+    with open(RESULTS_FILE_NAME, "w") as fout:
+        json.dump({"compile": compileRes, "score": score, "max_score": maxScore, "grade": result,
+                    "tests": testResults}, fout, indent=4)
+
+def grade(data, compileRes):
+    if compileRes == 0:
+        print("COMPILATION ERROR")
+        saveResults(compileRes, 0, 0, 0.0, [])
+        return 0, 0, 0.0
+    serv = Server()
+    resetSemaphore(serv.semName)
+    serv.start()
+
+    score = 0
+    maxScore = 0
+    testResults = []
+    for t in range(1,6):
+        tester = Tester(t, serv, data)
+        testScore, testMaxScore = tester.perform()
+        score += testScore
+        maxScore += testMaxScore
+        testResults.append(getTestResult("test %d" % t, testScore, testMaxScore, tester.proc))
+    serv.stop()
+    resetSemaphore(serv.semName)
+    print("Total score: %d / %d" % (score, maxScore))
+    result = 100.0 * score / maxScore
+    if compileRes == 1:
+        print("\033[1;31mThere were some compilation warnings. A 10% penalty will be applied.\033[0m")
+        result = result * 0.9
+    print("Assignment grade: %.2f / 100" % result)
+    saveResults(compileRes, score, maxScore, result, testResults)
+    return score, maxScore, result
+
+# runs a scenario with its own server; the first run of each scenario has no extra delays
+def runScenario(nr, data, run):
+    rng = random.Random("%d_%d" % (nr, run)) if run > 0 else None
+    serv = Server()
+    resetSemaphore(serv.semName)
+    serv.start()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        tester = Tester(nr, serv, data, rng)
+        tester.perform()
+    serv.stop()
+    resetSemaphore(serv.semName)
+    return tester.checkScores, tester.timedOut
+
+# runs every scenario several times, to expose synchronization bugs that appear only sometimes
+def checkFlakiness(data, compileRes, repeat, jobs):
+    if compileRes == 0:
+        print("COMPILATION ERROR")
+        saveResults(compileRes, 0, 0, 0.0, [])
+        return 0, 0, 0.0
+    checkMaxScore = Tester.CHECK_MAX_SCORE * len(Tester.CHECK_FUNCTIONS)
+    testResults = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = {}
+        for nr in range(1, 6):
+            futures[nr] = [pool.submit(runScenario, nr, data, run) for run in range(repeat)]
+        score = 0
+        maxScore = 0
+        for nr in range(1, 6):
+            results = [future.result() for future in futures[nr]]
+            print("\033[1;35mTest %d (%d runs)...\033[0m" % (nr, repeat))
+            timeouts = len([timedOut for _checkScores, timedOut in results if timedOut])
+            if timeouts > 0:
+                print("\t\033[1;31mTIME LIMIT EXCEEDED in %d run(s)\033[0m" % timeouts)
+            checks = []
+            for i, (_checkFn, checkName) in enumerate(Tester.CHECK_FUNCTIONS):
+                scores = [checkScores[i] for checkScores, _timedOut in results]
+                passed = len([sc for sc in scores if sc == Tester.CHECK_MAX_SCORE])
+                print("\t%s: %d%% correct, worst %d point(s)" % (checkName, 100 * passed // repeat, min(scores)))
+                checks.append({"name": checkName, "passed_runs": passed, "worst_score": min(scores),
+                                "max_score": Tester.CHECK_MAX_SCORE})
+            worst = min(sum(checkScores) for checkScores, _timedOut in results)
+            print("\tWorst run: %d / %d" % (worst, checkMaxScore))
+            testResults.append({"name": "test %d" % nr, "runs": repeat, "timeouts": timeouts,
+                                "score": worst, "max_score": checkMaxScore, "checks": checks})
+            score += worst
+            maxScore += checkMaxScore
+    print("Worst-case total score: %d / %d" % (score, maxScore))
+    result = 100.0 * score / maxScore
+    if compileRes == 1:
+        print("\033[1;31mThere were some compilation warnings. A 10% penalty will be applied.\033[0m")
+        result = result * 0.9
+    print("Worst-case assignment grade: %.2f / 100" % result)
+    saveResults(compileRes, score, maxScore, result, testResults)
+    return score, maxScore, result
 
 class DockerHelper:
     _REPO_NAME = "coprisa/utcn-os"
@@ -484,13 +1003,21 @@ class DockerHelper:
         return res.output.decode("utf-8", "ignore")
 
     def copyCompileLogFileInCurrentDirectory(self):
-        stream, _stat = self.container.get_archive(posixpath.join(DockerHelper._WORKING_DIR, COMPILE_LOG_FILE_NAME))
+        self.copyFileInCurrentDirectory(COMPILE_LOG_FILE_NAME)
+
+    # returns False if the file does not exist in the container
+    def copyFileInCurrentDirectory(self, fname):
+        try:
+            stream, _stat = self.container.get_archive(posixpath.join(DockerHelper._WORKING_DIR, fname))
+        except docker.errors.NotFound:
+            return False
         file_obj = io.BytesIO()
         for c in stream:
             file_obj.write(c)
         file_obj.seek(0)
         tar = tarfile.open(mode="r", fileobj=file_obj)
         tar.extractall(".")
+        return True
 
     def getContainerId(self):
         if self.container is not None:
@@ -509,6 +1036,21 @@ def main():
     parser.add_argument("-v", "--verbose", 
         action = "store_true",
         help = "Displays more details.")
+    parser.add_argument("--persistent",
+        action = "store_true",
+        help = "Each process sends all its messages to the tester over a single connection.")
+    parser.add_argument("--transport",
+        choices = ("tcp", "unix"),
+        default = "tcp",
+        help = "The socket type used by a2_helper to reach the tester.")
+    parser.add_argument("-r", "--repeat",
+        type = int,
+        default = 1,
+        help = "Runs every test this many times, with random extra delays, and reports the pass rates.")
+    parser.add_argument("-j", "--jobs",
+        type = int,
+        default = 0,
+        help = "Number of test runs executed at the same time with --repeat (0 uses all the CPUs).")
     args = parser.parse_args()
 
     if args.docker or args.docker_persist:
@@ -518,6 +1060,13 @@ def main():
         containerArgs = []
         if args.verbose:
             containerArgs.append("-v")
+        if args.persistent:
+            containerArgs.append("--persistent")
+        containerArgs += ["--transport", args.transport]
+        containerArgs += ["--repeat", str(args.repeat), "--jobs", str(args.jobs)]
+        # a results file left by an earlier run must not pass for the results of this one
+        if os.path.isfile(RESULTS_FILE_NAME):
+            os.remove(RESULTS_FILE_NAME)
         dh = DockerHelper()
         dh.runContainer()
         dh.copyDir(".")
@@ -526,6 +1075,8 @@ def main():
         logFile.write(res)
         logFile.close()
         dh.copyCompileLogFileInCurrentDirectory()
+        if not dh.copyFileInCurrentDirectory(RESULTS_FILE_NAME):
+            print("\033[1;31mThe tests did not write %s.\033[0m" % RESULTS_FILE_NAME)
         print(res)
         if args.docker_persist:
             containerId = dh.getContainerId()
@@ -537,37 +1088,18 @@ def main():
             except docker.errors.APIError:
                 print("Could not remove docker container.")
     else:
+        global VERBOSE, PROTOCOL, TRANSPORT
         if args.verbose:
-            global VERBOSE
             VERBOSE = True
+        if args.persistent:
+            PROTOCOL = "persistent"
+        TRANSPORT = args.transport
         compileRes = compile()
-        if compileRes == 0:
-            print("COMPILATION ERROR")
+        if args.repeat > 1:
+            jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+            checkFlakiness(loadData(), compileRes, args.repeat, jobs)
         else:
-            score = 0
-            resetSemaphore()
-            serv = Server()
-            serv.start()
-
-            with open("a2_data.json") as a2_data:
-                content = a2_data.read()
-                decoded_data = base64.b64decode(content).decode("utf-8")
-                data = json.loads(decoded_data)
-
-            score = 0
-            maxScore = 0
-            for t in range(1,6):
-                tester = Tester(t, serv, data)
-                testScore, testMaxScore = tester.perform()
-                score += testScore
-                maxScore += testMaxScore
-            serv.stop()
-            print("Total score: %d / %d" % (score, maxScore))
-            score = 100.0 * score / maxScore
-            if compileRes == 1:
-                print("\033[1;31mThere were some compilation warnings. A 10% penalty will be applied.\033[0m")
-                score = score * 0.9
-            print("Assignment grade: %.2f / 100" % score)
+            grade(loadData(), compileRes)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,531 @@
+#define _GNU_SOURCE
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <stdarg.h>
+#include <unistd.h>
+#include <dlfcn.h>
+#include <fcntl.h>
+#include <sys/types.h>
+#include <sys/mman.h>
+#include <sys/uio.h>
+#include <sys/syscall.h>
+
+// LD_PRELOAD library used by the a3 tester instead of strace: it records, in the strace
+// format, only the calls on files whose path contains "test_root", so that the
+// tester's strace analysis gives the same verdict without stopping on every syscall.
+// The stdio functions are interposed as well, since glibc does not call read()
+// through the PLT, and so are the _FORTIFY_SOURCE variants and the calls made through
+// syscall(). Only the successful calls are logged.
+// The tracing is best-effort: system calls made with inline assembly or io_uring, and
+// stdio functions that the compiler inlines (getc_unlocked() with optimizations), are
+// not seen, which is why strace stays the tester's default.
+
+#define LOG_ENV "A3_TRACE_LOG"
+#define TRACED_PATH "test_root"
+#define MAX_FDS 4096
+#define LINE_SIZE 512
+
+static int logFd = -1;
+static char traced[MAX_FDS];
+
+static int (*real_open)(const char*, int, ...);
+static int (*real_open64)(const char*, int, ...);
+static int (*real_openat)(int, const char*, int, ...);
+static int (*real_openat64)(int, const char*, int, ...);
+static FILE *(*real_fopen)(const char*, const char*);
+static FILE *(*real_fopen64)(const char*, const char*);
+static int (*real_close)(int);
+static int (*real_fclose)(FILE*);
+static int (*real_dup)(int);
+static int (*real_dup2)(int, int);
+static int (*real_dup3)(int, int, int);
+static void *(*real_mmap)(void*, size_t, int, int, int, off_t);
+static void *(*real_mmap64)(void*, size_t, int, int, int, off64_t);
+static ssize_t (*real_read)(int, void*, size_t);
+static ssize_t (*real_pread)(int, void*, size_t, off_t);
+static ssize_t (*real_pread64)(int, void*, size_t, off64_t);
+static ssize_t (*real_readv)(int, const struct iovec*, int);
+static ssize_t (*real_preadv)(int, const struct iovec*, int, off_t);
+static ssize_t (*real_preadv64)(int, const struct iovec*, int, off64_t);
+static ssize_t (*real_preadv2)(int, const struct iovec*, int, off_t, int);
+static ssize_t (*real_preadv64v2)(int, const struct iovec*, int, off64_t, int);
+static ssize_t (*real_read_chk)(int, void*, size_t, size_t);
+static ssize_t (*real_pread_chk)(int, void*, size_t, off_t, size_t);
+static ssize_t (*real_pread64_chk)(int, void*, size_t, off64_t, size_t);
+static long (*real_syscall)(long, ...);
+static size_t (*real_fread)(void*, size_t, size_t, FILE*);
+static size_t (*real_fread_unlocked)(void*, size_t, size_t, FILE*);
+static size_t (*real_fread_chk)(void*, size_t, size_t, size_t, FILE*);
+static char *(*real_fgets)(char*, int, FILE*);
+static char *(*real_fgets_unlocked)(char*, int, FILE*);
+static char *(*real_fgets_chk)(char*, size_t, int, FILE*);
+static int (*real_fgetc)(FILE*);
+static int (*real_getc)(FILE*);
+static int (*real_fgetc_unlocked)(FILE*);
+static int (*real_getc_unlocked)(FILE*);
+static ssize_t (*real_getdelim)(char**, size_t*, int, FILE*);
+static int (*real_vfscanf)(FILE*, const char*, va_list);
+static int (*real_isoc99_vfscanf)(FILE*, const char*, va_list);
+
+__attribute__((constructor))
+static void init(){
+    char *logPath = getenv(LOG_ENV);
+
+    real_open = dlsym(RTLD_NEXT, "open");
+    real_open64 = dlsym(RTLD_NEXT, "open64");
+    real_openat = dlsym(RTLD_NEXT, "openat");
+    real_openat64 = dlsym(RTLD_NEXT, "openat64");
+    real_fopen = dlsym(RTLD_NEXT, "fopen");
+    real_fopen64 = dlsym(RTLD_NEXT, "fopen64");
+    real_close = dlsym(RTLD_NEXT, "close");
+    real_fclose = dlsym(RTLD_NEXT, "fclose");
+    real_dup = dlsym(RTLD_NEXT, "dup");
+    real_dup2 = dlsym(RTLD_NEXT, "dup2");
+    real_dup3 = dlsym(RTLD_NEXT, "dup3");
+    real_mmap = dlsym(RTLD_NEXT, "mmap");
+    real_mmap64 = dlsym(RTLD_NEXT, "mmap64");
+    real_read = dlsym(RTLD_NEXT, "read");
+    real_pread = dlsym(RTLD_NEXT, "pread");
+    real_pread64 = dlsym(RTLD_NEXT, "pread64");
+    real_readv = dlsym(RTLD_NEXT, "readv");
+    real_preadv = dlsym(RTLD_NEXT, "preadv");
+    real_preadv64 = dlsym(RTLD_NEXT, "preadv64");
+    real_preadv2 = dlsym(RTLD_NEXT, "preadv2");
+    real_preadv64v2 = dlsym(RTLD_NEXT, "preadv64v2");
+    real_read_chk = dlsym(RTLD_NEXT, "__read_chk");
+    real_pread_chk = dlsym(RTLD_NEXT, "__pread_chk");
+    real_pread64_chk = dlsym(RTLD_NEXT, "__pread64_chk");
+    real_syscall = dlsym(RTLD_NEXT, "syscall");
+    real_fread = dlsym(RTLD_NEXT, "fread");
+    real_fread_unlocked = dlsym(RTLD_NEXT, "fread_unlocked");
+    real_fread_chk = dlsym(RTLD_NEXT, "__fread_chk");
+    real_fgets = dlsym(RTLD_NEXT, "fgets");
+    real_fgets_unlocked = dlsym(RTLD_NEXT, "fgets_unlocked");
+    real_fgets_chk = dlsym(RTLD_NEXT, "__fgets_chk");
+    real_fgetc = dlsym(RTLD_NEXT, "fgetc");
+    real_getc = dlsym(RTLD_NEXT, "getc");
+    real_fgetc_unlocked = dlsym(RTLD_NEXT, "fgetc_unlocked");
+    real_getc_unlocked = dlsym(RTLD_NEXT, "getc_unlocked");
+    real_getdelim = dlsym(RTLD_NEXT, "getdelim");
+    real_vfscanf = dlsym(RTLD_NEXT, "vfscanf");
+    real_isoc99_vfscanf = dlsym(RTLD_NEXT, "__isoc99_vfscanf");
+    if(real_isoc99_vfscanf == NULL){
+        real_isoc99_vfscanf = real_vfscanf;
+    }
+    if(logPath != NULL){
+        logFd = real_open(logPath, O_WRONLY | O_CREAT | O_APPEND | O_CLOEXEC, 0644);
+    }
+}
+
+static int isTraced(int fd){
+    return fd >= 0 && fd < MAX_FDS && traced[fd];
+}
+
+static void setTraced(int fd, int value){
+    if(fd >= 0 && fd < MAX_FDS){
+        traced[fd] = value;
+    }
+}
+
+// every line is written with a single write(), so lines from several threads do not mix
+static void logLine(const char *format, ...){
+    char line[LINE_SIZE];
+    va_list args;
+    int len;
+
+    if(logFd < 0){
+        return;
+    }
+    va_start(args, format);
+    len = vsnprintf(line, sizeof(line) - 1, format, args);
+    va_end(args);
+    if(len < 0){
+        return;
+    }
+    if(len > (int)sizeof(line) - 2){
+        len = sizeof(line) - 2;
+    }
+    line[len] = '\n';
+    if(write(logFd, line, len + 1) < 0){
+        return;
+    }
+}
+
+static void logOpen(const char *call, int dirfd, const char *path, int fd){
+    if(fd < 0){
+        return;
+    }
+    setTraced(fd, 0);
+    if(path == NULL || strstr(path, TRACED_PATH) == NULL){
+        return;
+    }
+    setTraced(fd, 1);
+    if(dirfd == AT_FDCWD){
+        logLine("%s(AT_FDCWD, \"%s\", O_RDONLY) = %d", call, path, fd);
+    }else if(dirfd >= 0){
+        logLine("%s(%d, \"%s\", O_RDONLY) = %d", call, dirfd, path, fd);
+    }else{
+        logLine("%s(\"%s\", O_RDONLY) = %d", call, path, fd);
+    }
+}
+
+static void logClose(int fd, int res){
+    if(res == 0 && isTraced(fd)){
+        setTraced(fd, 0);
+        logLine("close(%d) = 0", fd);
+    }
+}
+
+static void logDup(const char *call, int oldFd, int newFd){
+    if(newFd < 0 || newFd == oldFd){
+        return;
+    }
+    // the new descriptor was closed by dup2() or dup3() if it was open
+    setTraced(newFd, 0);
+    if(isTraced(oldFd)){
+        setTraced(newFd, 1);
+        if(strcmp(call, "dup") == 0){
+            logLine("dup(%d) = %d", oldFd, newFd);
+        }else{
+            logLine("%s(%d, %d) = %d", call, oldFd, newFd, newFd);
+        }
+    }
+}
+
+static void logRead(int fd, ssize_t res){
+    if(res >= 0 && isTraced(fd)){
+        logLine("read(%d, ...) = %ld", fd, (long)res);
+    }
+}
+
+static void logMmap(int fd, size_t length, void *res){
+    if(res != MAP_FAILED && isTraced(fd)){
+        logLine("mmap(NULL, %lu, PROT_READ, MAP_SHARED, %d, 0) = %p", (unsigned long)length, fd, res);
+    }
+}
+
+static int getMode(int flags, va_list args){
+    if((flags & O_CREAT) || (flags & O_TMPFILE) == O_TMPFILE){
+        return va_arg(args, int);
+    }
+    return 0;
+}
+
+int open(const char *path, int flags, ...){
+    va_list args;
+    int mode, fd;
+
+    va_start(args, flags);
+    mode = getMode(flags, args);
+    va_end(args);
+    fd = real_open(path, flags, mode);
+    logOpen("open", -1, path, fd);
+    return fd;
+}
+
+int open64(const char *path, int flags, ...){
+    va_list args;
+    int mode, fd;
+
+    va_start(args, flags);
+    mode = getMode(flags, args);
+    va_end(args);
+    fd = real_open64(path, flags, mode);
+    logOpen("open", -1, path, fd);
+    return fd;
+}
+
+int openat(int dirfd, const char *path, int flags, ...){
+    va_list args;
+    int mode, fd;
+
+    va_start(args, flags);
+    mode = getMode(flags, args);
+    va_end(args);
+    fd = real_openat(dirfd, path, flags, mode);
+    logOpen("openat", dirfd, path, fd);
+    return fd;
+}
+
+int openat64(int dirfd, const char *path, int flags, ...){
+    va_list args;
+    int mode, fd;
+
+    va_start(args, flags);
+    mode = getMode(flags, args);
+    va_end(args);
+    fd = real_openat64(dirfd, path, flags, mode);
+    logOpen("openat", dirfd, path, fd);
+    return fd;
+}
+
+FILE *fopen(const char *path, const char *mode){
+    FILE *f = real_fopen(path, mode);
+    if(f != NULL){
+        logOpen("openat", AT_FDCWD, path, fileno(f));
+    }
+    return f;
+}
+
+FILE *fopen64(const char *path, const char *mode){
+    FILE *f = real_fopen64(path, mode);
+    if(f != NULL){
+        logOpen("openat", AT_FDCWD, path, fileno(f));
+    }
+    return f;
+}
+
+int close(int fd){
+    int res = real_close(fd);
+    logClose(fd, res);
+    return res;
+}
+
+int fclose(FILE *f){
+    int fd = fileno(f);
+    int res = real_fclose(f);
+    logClose(fd, res == 0 ? 0 : -1);
+    return res;
+}
+
+int dup(int oldFd){
+    int newFd = real_dup(oldFd);
+    logDup("dup", oldFd, newFd);
+    return newFd;
+}
+
+int dup2(int oldFd, int newFd){
+    int res = real_dup2(oldFd, newFd);
+    logDup("dup2", oldFd, res);
+    return res;
+}
+
+int dup3(int oldFd, int newFd, int flags){
+    int res = real_dup3(oldFd, newFd, flags);
+    logDup("dup3", oldFd, res);
+    return res;
+}
+
+void *mmap(void *addr, size_t length, int prot, int flags, int fd, off_t offset){
+    void *res = real_mmap(addr, length, prot, flags, fd, offset);
+    logMmap(fd, length, res);
+    return res;
+}
+
+void *mmap64(void *addr, size_t length, int prot, int flags, int fd, off64_t offset){
+    void *res = real_mmap64(addr, length, prot, flags, fd, offset);
+    logMmap(fd, length, res);
+    return res;
+}
+
+ssize_t read(int fd, void *buf, size_t count){
+    ssize_t res = real_read(fd, buf, count);
+    logRead(fd, res);
+    return res;
+}
+
+ssize_t pread(int fd, void *buf, size_t count, off_t offset){
+    ssize_t res = real_pread(fd, buf, count, offset);
+    logRead(fd, res);
+    return res;
+}
+
+ssize_t pread64(int fd, void *buf, size_t count, off64_t offset){
+    ssize_t res = real_pread64(fd, buf, count, offset);
+    logRead(fd, res);
+    return res;
+}
+
+ssize_t readv(int fd, const struct iovec *iov, int iovcnt){
+    ssize_t res = real_readv(fd, iov, iovcnt);
+    logRead(fd, res);
+    return res;
+}
+
+ssize_t preadv(int fd, const struct iovec *iov, int iovcnt, off_t offset){
+    ssize_t res = real_preadv(fd, iov, iovcnt, offset);
+    logRead(fd, res);
+    return res;
+}
+
+ssize_t preadv64(int fd, const struct iovec *iov, int iovcnt, off64_t offset){
+    ssize_t res = real_preadv64(fd, iov, iovcnt, offset);
+    logRead(fd, res);
+    return res;
+}
+
+ssize_t preadv2(int fd, const struct iovec *iov, int iovcnt, off_t offset, int flags){
+    ssize_t res = real_preadv2(fd, iov, iovcnt, offset, flags);
+    logRead(fd, res);
+    return res;
+}
+
+ssize_t preadv64v2(int fd, const struct iovec *iov, int iovcnt, off64_t offset, int flags){
+    ssize_t res = real_preadv64v2(fd, iov, iovcnt, offset, flags);
+    logRead(fd, res);
+    return res;
+}
+
+// read() and pread() become these with _FORTIFY_SOURCE when the buffer size is known
+ssize_t __read_chk(int fd, void *buf, size_t count, size_t bufSize){
+    ssize_t res = real_read_chk(fd, buf, count, bufSize);
+    logRead(fd, res);
+    return res;
+}
+
+ssize_t __pread_chk(int fd, void *buf, size_t count, off_t offset, size_t bufSize){
+    ssize_t res = real_pread_chk(fd, buf, count, offset, bufSize);
+    logRead(fd, res);
+    return res;
+}
+
+ssize_t __pread64_chk(int fd, void *buf, size_t count, off64_t offset, size_t bufSize){
+    ssize_t res = real_pread64_chk(fd, buf, count, offset, bufSize);
+    logRead(fd, res);
+    return res;
+}
+
+// the arguments of syscall() are read as six longs, the way the C library itself does
+long syscall(long number, ...){
+    va_list args;
+    long a[6];
+    long res;
+    int i;
+
+    va_start(args, number);
+    for(i = 0; i < 6; i++){
+        a[i] = va_arg(args, long);
+    }
+    va_end(args);
+    res = real_syscall(number, a[0], a[1], a[2], a[3], a[4], a[5]);
+    switch(number){
+#ifdef SYS_open
+    case SYS_open:
+        logOpen("open", -1, (const char*)a[0], (int)res);
+        break;
+#endif
+    case SYS_openat:
+        logOpen("openat", (int)a[0], (const char*)a[1], (int)res);
+        break;
+    case SYS_close:
+        logClose((int)a[0], (int)res);
+        break;
+#ifdef SYS_mmap
+    case SYS_mmap:
+        logMmap((int)a[4], (size_t)a[1], (void*)res);
+        break;
+#endif
+    case SYS_read:
+    case SYS_pread64:
+    case SYS_readv:
+    case SYS_preadv:
+#ifdef SYS_preadv2
+    case SYS_preadv2:
+#endif
+        logRead((int)a[0], res);
+        break;
+    }
+    return res;
+}
+
+size_t fread(void *ptr, size_t size, size_t nmemb, FILE *f){
+    size_t res = real_fread(ptr, size, nmemb, f);
+    logRead(fileno(f), res * size);
+    return res;
+}
+
+// fread_unlocked() is a macro in stdio.h with optimizations
+#undef fread_unlocked
+size_t fread_unlocked(void *ptr, size_t size, size_t nmemb, FILE *f){
+    size_t res = real_fread_unlocked(ptr, size, nmemb, f);
+    logRead(fileno(f), res * size);
+    return res;
+}
+
+size_t __fread_chk(void *ptr, size_t ptrSize, size_t size, size_t nmemb, FILE *f){
+    size_t res = real_fread_chk(ptr, ptrSize, size, nmemb, f);
+    logRead(fileno(f), res * size);
+    return res;
+}
+
+char *fgets(char *s, int size, FILE *f){
+    char *res = real_fgets(s, size, f);
+    logRead(fileno(f), res != NULL ? (ssize_t)strlen(res) : 0);
+    return res;
+}
+
+char *fgets_unlocked(char *s, int size, FILE *f){
+    char *res = real_fgets_unlocked(s, size, f);
+    logRead(fileno(f), res != NULL ? (ssize_t)strlen(res) : 0);
+    return res;
+}
+
+char *__fgets_chk(char *s, size_t sSize, int size, FILE *f){
+    char *res = real_fgets_chk(s, sSize, size, f);
+    logRead(fileno(f), res != NULL ? (ssize_t)strlen(res) : 0);
+    return res;
+}
+
+int fgetc(FILE *f){
+    int res = real_fgetc(f);
+    logRead(fileno(f), res != EOF ? 1 : 0);
+    return res;
+}
+
+int getc(FILE *f){
+    int res = real_getc(f);
+    logRead(fileno(f), res != EOF ? 1 : 0);
+    return res;
+}
+
+int fgetc_unlocked(FILE *f){
+    int res = real_fgetc_unlocked(f);
+    logRead(fileno(f), res != EOF ? 1 : 0);
+    return res;
+}
+
+// getc_unlocked() may also be a macro; this catches the calls that are not inlined
+#undef getc_unlocked
+int getc_unlocked(FILE *f){
+    int res = real_getc_unlocked(f);
+    logRead(fileno(f), res != EOF ? 1 : 0);
+    return res;
+}
+
+ssize_t getdelim(char **line, size_t *n, int delim, FILE *f){
+    ssize_t res = real_getdelim(line, n, delim, f);
+    logRead(fileno(f), res >= 0 ? res : 0);
+    return res;
+}
+
+ssize_t getline(char **line, size_t *n, FILE *f){
+    return getdelim(line, n, '\n', f);
+}
+
+// stdio.h may redirect fscanf() to __isoc99_fscanf() (or the other way around), so both
+// symbols are defined through assembler names instead of the redirected declarations
+int traceFscanf(FILE *f, const char *format, ...) __asm__("fscanf");
+int traceIsoc99Fscanf(FILE *f, const char *format, ...) __asm__("__isoc99_fscanf");
+
+int traceFscanf(FILE *f, const char *format, ...){
+    va_list args;
+    int res;
+
+    va_start(args, format);
+    res = real_vfscanf(f, format, args);
+    va_end(args);
+    logRead(fileno(f), res >= 0 ? res : 0);
+    return res;
+}
+
+int traceIsoc99Fscanf(FILE *f, const char *format, ...){
+    va_list args;
+    int res;
+
+    va_start(args, format);
+    res = real_isoc99_vfscanf(f, format, args);
+    va_end(args);
+    logRead(fileno(f), res >= 0 ? res : 0);
+    return res;
+}
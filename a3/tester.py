@@ -1,14 +1,35 @@
 #!/usr/bin/env python3
-import re, os, sys, struct, subprocess, json, base64
-import threading, ctypes, ctypes.util, random, tarfile, io, posixpath
-import argparse
+import re, os, sys, struct, subprocess, json, base64, selectors, signal, time, contextlib
+import threading, random, tarfile, io, posixpath, mmap, hashlib, hmac, shutil
+import argparse, tempfile
 
 A3_PROG = "a3"
 
 VERBOSE = False
 TIME_LIMIT = 3
+# "strace" traces every test, "checkmap" only the tests with the mmap check and
+# "preload" records the calls of those tests with the a3_trace.so interposer instead of strace;
+# the interposer is best-effort (see a3_trace.c), so strace stays the default
+TRACE_MODE = "strace"
+TRACE_LOG_FILE_NAME = "strace.log"
+TRACER_SOURCE = "a3_trace.c"
+TRACER_LIB = "a3_trace.so"
+
+# the stress mode sends random READ_FROM_* requests, some of them out of range,
+# and gives the solution this much time for each of them
+STRESS_COMMANDS = ("READ_FROM_FILE_OFFSET", "READ_FROM_FILE_SECTION", "READ_FROM_LOGICAL_SPACE_OFFSET")
+STRESS_ERROR_RATIO = 0.2
+STRESS_REQUEST_TIME = 0.01
+PERCENTILES = (50, 90, 99)
 
 COMPILE_LOG_FILE_NAME = "compile_log.txt"
+RESULTS_FILE_NAME = "results.json"
+# POSIX shared memory objects are files in this directory on Linux
+SHM_DIR = "/dev/shm"
+
+# compiled submissions are cached here; set OS_TESTER_CACHE="" to disable
+CACHE_DIR = os.environ.get("OS_TESTER_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "os-tester"))
+BUILD_CACHE_MAX_SIZE = 256 * 1024 * 1024
 
 try:
     import docker
@@ -20,10 +41,13 @@ def compile():
     if os.path.isfile(A3_PROG):
         os.remove(A3_PROG)
     LOG_FILE = "compile_log.txt"
-    compLog = open(LOG_FILE, "w")
-    subprocess.call(["gcc", "-Wall", "%s.c" % A3_PROG, "-o", A3_PROG, "-lrt"], 
-                        stdout=compLog, stderr=compLog)
-    compLog.close()
+    cmd = ["gcc", "-Wall", "%s.c" % A3_PROG, "-o", A3_PROG, "-lrt"]
+    key = buildKey(cmd)
+    if not restoreBuild(key, A3_PROG):
+        compLog = open(LOG_FILE, "w")
+        subprocess.call(cmd, stdout=compLog, stderr=compLog)
+        compLog.close()
+        storeBuild(key, A3_PROG)
     if os.path.isfile(A3_PROG):
         compLog = open(LOG_FILE)
         logContent = compLog.read()
@@ -34,95 +58,543 @@ def compile():
     else:
         return 0
 
+COMPILER_VERSION = None
+
+def getCompilerVersion():
+    global COMPILER_VERSION
+    if COMPILER_VERSION is None:
+        try:
+            COMPILER_VERSION = subprocess.run(["gcc", "--version"], stdout=subprocess.PIPE,
+                                                stderr=subprocess.DEVNULL).stdout.decode(errors="ignore")
+        except OSError:
+            COMPILER_VERSION = ""
+    return COMPILER_VERSION
+
+# the key covers the command, the compiler version, the sources and all the headers
+# of the current directory; None if a source is missing
+def buildKey(cmd):
+    sources = [arg for arg in cmd if arg.endswith(".c")] + sorted(f for f in os.listdir(".") if f.endswith(".h"))
+    h = hashlib.sha256(json.dumps({"cmd": cmd, "compiler": getCompilerVersion()}).encode())
+    for src in sources:
+        try:
+            fin = open(src, "rb")
+        except OSError:
+            return None
+        h.update(b"\0%s\0" % src.encode())
+        h.update(fin.read())
+        fin.close()
+    return h.hexdigest()
+
+def buildCacheDir():
+    if not CACHE_DIR:
+        return None
+    return os.path.join(CACHE_DIR, "a3_builds")
+
+# a cached build has the compile log and, if the compilation succeeded, the binary
+def restoreBuild(key, prog):
+    cacheDir = buildCacheDir()
+    if cacheDir is None or key is None:
+        return False
+    entry = os.path.join(cacheDir, key)
+    if not os.path.isfile(os.path.join(entry, COMPILE_LOG_FILE_NAME)):
+        return False
+    try:
+        shutil.copy(os.path.join(entry, COMPILE_LOG_FILE_NAME), COMPILE_LOG_FILE_NAME)
+        if os.path.isfile(os.path.join(entry, prog)):
+            shutil.copy2(os.path.join(entry, prog), prog)
+        os.utime(entry)
+    except OSError:
+        # the entry was evicted by another tester in the meantime
+        return False
+    return True
+
+def storeBuild(key, prog):
+    cacheDir = buildCacheDir()
+    if cacheDir is None or key is None:
+        return
+    entry = os.path.join(cacheDir, key)
+    if os.path.isdir(entry):
+        return
+    tmpEntry = None
+    try:
+        os.makedirs(cacheDir, exist_ok=True)
+        tmpEntry = tempfile.mkdtemp(prefix="%s.tmp" % key, dir=cacheDir)
+        shutil.copy(COMPILE_LOG_FILE_NAME, tmpEntry)
+        if os.path.isfile(prog):
+            shutil.copy2(prog, tmpEntry)
+        try:
+            os.rename(tmpEntry, entry)
+            tmpEntry = None
+        except OSError:
+            # another tester stored the same build in the meantime
+            pass
+        evictCache(cacheDir, BUILD_CACHE_MAX_SIZE)
+    except OSError as e:
+        print("Could not save the build in the cache: %s" % e)
+    if tmpEntry is not None:
+        shutil.rmtree(tmpEntry, ignore_errors=True)
+
+# files removed by another tester while the tree is walked are not counted
+def getTreeSize(path):
+    size = 0
+    for root, _dirs, files in os.walk(path):
+        for name in files:
+            try:
+                size += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return size
+
+# staging directories older than this were left by a tester that died while storing an entry
+STALE_TMP_AGE = 3600
+
+# several testers may share the cache, so an entry is renamed to a staging name before it is
+# removed, and a restore sees either the whole entry or none of it
+def removeCacheEntry(entry):
+    tmpEntry = "%s.tmp%s" % (entry, os.urandom(8).hex())
+    try:
+        os.rename(entry, tmpEntry)
+    except OSError:
+        # another tester removed it first
+        return
+    shutil.rmtree(tmpEntry, ignore_errors=True)
+
+# the entries that disappear while the cache is scanned are skipped
+def evictCache(cacheDir, maxSize):
+    entries = []
+    now = time.time()
+    for name in os.listdir(cacheDir):
+        entry = os.path.join(cacheDir, name)
+        try:
+            mtime = os.path.getmtime(entry)
+            if not os.path.isdir(entry):
+                continue
+            if ".tmp" in name:
+                if now - mtime > STALE_TMP_AGE:
+                    shutil.rmtree(entry, ignore_errors=True)
+                continue
+            entries.append((mtime, getTreeSize(entry), entry))
+        except OSError:
+            continue
+    entries.sort(reverse=True)
+    total = 0
+    for _mtime, size, entry in entries:
+        total += size
+        if total > maxSize:
+            removeCacheEntry(entry)
+
+# the process runner below is the same in the a1, a2 and a3 testers: every tester directory
+# is copied on its own into the grading container, so it cannot import a shared module;
+# a change to it must be made in all three copies
+
+# how often the processes are polled when the kernel has no pidfd support
+POLL_INTERVAL = 0.01
+
+# a test process supervised by runProcesses(); it runs in its own session,
+# so that it can be killed together with all the processes it creates
+class TestProcess:
+    def __init__(self, cmd, timeLimit, capture=False, quiet=True, env=None):
+        self.cmd = cmd
+        self.timeLimit = timeLimit
+        self.capture = capture
+        self.quiet = quiet
+        self.env = env
+        self.p = None
+        self.pidfd = None
+        self.streams = {}
+        self.output = []
+        self.err = []
+        self.startTime = None
+        self.deadline = None
+        self.elapsed = None
+        self.userTime = None
+        self.sysTime = None
+        self.timeout = False
+        self.exited = False
+
+    def start(self, selector):
+        if self.capture:
+            stdout = stderr = subprocess.PIPE
+        elif self.quiet:
+            stdout = stderr = subprocess.DEVNULL
+        else:
+            stdout = stderr = None
+        self.startTime = time.perf_counter()
+        self.deadline = self.startTime + self.timeLimit
+        try:
+            self.p = subprocess.Popen(self.cmd, stdout=stdout, stderr=stderr, env=self.env, start_new_session=True)
+        except OSError as e:
+            # a missing or broken binary counts as a test that produced no output
+            self.err.append(str(e).encode())
+            self.elapsed = 0
+            self.exited = True
+            return
+        if self.capture:
+            for stream, chunks in ((self.p.stdout, self.output), (self.p.stderr, self.err)):
+                os.set_blocking(stream.fileno(), False)
+                self.streams[stream] = chunks
+                selector.register(stream, selectors.EVENT_READ, self)
+        try:
+            self.pidfd = os.pidfd_open(self.p.pid)
+            selector.register(self.pidfd, selectors.EVENT_READ, self)
+        except (AttributeError, OSError):
+            self.pidfd = None
+
+    def handle(self, selector, fileobj):
+        if fileobj in self.streams:
+            self.readStream(selector, fileobj)
+        else:
+            self.checkExit(selector)
+
+    def readStream(self, selector, stream):
+        try:
+            chunk = os.read(stream.fileno(), 65536)
+        except BlockingIOError:
+            return
+        if chunk:
+            self.streams[stream].append(chunk)
+        else:
+            selector.unregister(stream)
+            del self.streams[stream]
+            stream.close()
+
+    def checkExit(self, selector):
+        if self.exited or os.waitid(os.P_PID, self.p.pid, os.WEXITED | os.WNOHANG | os.WNOWAIT) is None:
+            return
+        self.elapsed = time.perf_counter() - self.startTime
+        self.exited = True
+        # the process is not reaped yet, so its id still names the process group
+        # and the processes left behind can be killed safely
+        self.kill()
+        # the resource usage includes the children that the process waited for
+        _pid, status, usage = os.wait4(self.p.pid, 0)
+        self.p.returncode = os.waitstatus_to_exitcode(status)
+        self.userTime = usage.ru_utime
+        self.sysTime = usage.ru_stime
+        if self.pidfd is not None:
+            selector.unregister(self.pidfd)
+            os.close(self.pidfd)
+            self.pidfd = None
+
+    def kill(self):
+        if self.p is None or self.p.returncode is not None:
+            return
+        try:
+            os.killpg(self.p.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    def done(self):
+        return self.exited and len(self.streams) == 0
+
+    def getOutput(self):
+        return b"".join(self.output)
+
+    def getErrors(self):
+        return b"".join(self.err)
+
+# wall time and CPU times are in seconds; there is no peak RSS, since the kernel keeps the
+# peak RSS across exec and ru_maxrss would report the RSS of the tester at the time of the fork
+def getTestResult(name, score, maxScore, proc):
+    return {"name": name, "score": score, "max_score": maxScore, "timeout": proc.timeout,
+            "wall_time": proc.elapsed, "user_time": proc.userTime, "sys_time": proc.sysTime}
+
+# runs the processes from a single event loop, with at most jobs of them at the same time;
+# onStart is called right after each process is started
+def runProcesses(procs, jobs=1, onStart=None):
+    selector = selectors.DefaultSelector()
+    waiting = list(reversed(procs))
+    running = []
+    try:
+        while len(waiting) > 0 or len(running) > 0:
+            while len(waiting) > 0 and len(running) < jobs:
+                proc = waiting.pop()
+                proc.start(selector)
+                running.append(proc)
+                if onStart is not None:
+                    onStart(proc)
+            # a process that could not be started is already done and has nothing to wait for
+            running = [proc for proc in running if not proc.done()]
+            if len(running) == 0:
+                continue
+            timeout = None
+            deadlines = [proc.deadline for proc in running if not proc.exited and not proc.timeout]
+            if len(deadlines) > 0:
+                timeout = max(0, min(deadlines) - time.perf_counter())
+            if any(proc.pidfd is None and not proc.exited for proc in running):
+                timeout = POLL_INTERVAL if timeout is None else min(timeout, POLL_INTERVAL)
+            for key, _events in selector.select(timeout):
+                key.data.handle(selector, key.fileobj)
+            now = time.perf_counter()
+            for proc in running:
+                if proc.pidfd is None:
+                    proc.checkExit(selector)
+                if not proc.exited and not proc.timeout and now >= proc.deadline:
+                    proc.timeout = True
+                    proc.kill()
+            running = [proc for proc in running if not proc.done()]
+    finally:
+        for proc in running:
+            proc.kill()
+            for stream in proc.streams:
+                stream.close()
+            if proc.pidfd is not None:
+                os.close(proc.pidfd)
+            if proc.p is not None:
+                proc.p.wait()
+        selector.close()
+
+# a file opened by the traced process; dup() adds references to it
+class OpenFile:
+    def __init__(self, name):
+        self.name = name
+        self.refs = 1
+        self.mapped = False
+
+# follows the file descriptors of an strace log one line at a time, so the memory it uses
+# depends only on the number of files that are open at the same time; a test_root file
+# must not be read and must be mapped before its last descriptor is closed
+class StraceAnalyzer:
+    CALLS = ["open", "openat", "close", "dup", "dup2", "dup3", "mmap", "read"]
+    RX_CALL = re.compile(rb"([a-z0-9_]+)\((.*)\)\s+=\s+([a-z0-9]+)")
+
+    def __init__(self):
+        self.fds = {}
+        self.readFile = None
+        self.unmappedFile = None
+
+    def feed(self, line):
+        m = StraceAnalyzer.RX_CALL.search(line)
+        if m is None:
+            return
+        call, params, result = m.groups()
+        params = params.split(b",")
+        if call == b"open":
+            self.openFd(result, params[0].strip())
+        elif call == b"openat":
+            self.openFd(result, params[1].strip())
+        elif call == b"close":
+            self.closeFd(params[0].strip())
+        elif call in (b"dup", b"dup2", b"dup3"):
+            oldFd = params[0].strip()
+            if oldFd in self.fds and result != oldFd:
+                # dup2() and dup3() silently close the new descriptor if it is open
+                self.closeFd(result)
+                self.fds[result] = self.fds[oldFd]
+                self.fds[result].refs += 1
+        elif call == b"read":
+            openFile = self.fds.get(params[0].strip())
+            if openFile is not None and b"test_root" in openFile.name and self.readFile is None:
+                self.readFile = openFile.name
+        elif call == b"mmap" and len(params) > 4:
+            openFile = self.fds.get(params[4].strip())
+            if openFile is not None:
+                openFile.mapped = True
+
+    def openFd(self, fd, name):
+        self.closeFd(fd)
+        self.fds[fd] = OpenFile(name)
+
+    def closeFd(self, fd):
+        openFile = self.fds.pop(fd, None)
+        if openFile is None:
+            return
+        openFile.refs -= 1
+        if openFile.refs == 0 and b"test_root" in openFile.name and not openFile.mapped:
+            if self.unmappedFile is None:
+                self.unmappedFile = openFile.name
+
+    def finish(self):
+        for fd in list(self.fds):
+            self.closeFd(fd)
+        if self.readFile is not None:
+            print("[TESTER] read system call detected on file %s" % self.readFile)
+            return False
+        if self.unmappedFile is not None:
+            print("[TESTER] no mmap system call on file %s" % self.unmappedFile)
+            return False
+        return True
+
+# the framing of the a3 pipe protocol: a string is preceded by its size or followed by
+# the terminator; every frame is sent with a single write and the replies are read in
+# large chunks, so that a string costs one system call instead of one for each byte
+class PipeCodec:
+    MAX_STRING_SIZE = 255
+    READ_SIZE = 65536
+
+    def __init__(self, data):
+        self.sizeFirst = data["strings_size_first"]
+        self.terminator = data["strings_terminator"].encode()
+        self.fin = None
+        self.buffer = bytearray()
+
+    def attach(self, fin):
+        self.fin = fin
+        self.buffer = bytearray()
+
+    def encodeNumber(self, nr):
+        return struct.pack("I", nr)
+
+    def encodeString(self, s):
+        if isinstance(s, str):
+            s = s.encode()
+        if self.sizeFirst:
+            return struct.pack("B", len(s)) + s
+        return s + self.terminator
+
+    # returns False at the end of the stream
+    def fill(self):
+        chunk = self.fin.read(PipeCodec.READ_SIZE)
+        if not chunk:
+            return False
+        self.buffer += chunk
+        return True
+
+    def readExact(self, size):
+        while len(self.buffer) < size:
+            if not self.fill():
+                return None
+        res = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return res
+
+    def readUntil(self, terminator, maxSize):
+        start = 0
+        while True:
+            pos = self.buffer.find(terminator, start)
+            if pos >= 0:
+                break
+            if len(self.buffer) > maxSize:
+                return None
+            start = max(0, len(self.buffer) - len(terminator) + 1)
+            if not self.fill():
+                return None
+        if pos > maxSize:
+            return None
+        res = bytes(self.buffer[:pos])
+        del self.buffer[:pos + len(terminator)]
+        return res
+
+    def readNumber(self):
+        x = self.readExact(4)
+        if x is None:
+            return None
+        return struct.unpack("I", x)[0]
+
+    def readString(self):
+        if self.sizeFirst:
+            size = self.readExact(1)
+            if size is None:
+                return None
+            return self.readExact(size[0])
+        return self.readUntil(self.terminator, PipeCodec.MAX_STRING_SIZE)
+
+# a file mapped read-only by the tester; the regions are compared through memoryview slices,
+# so checking a reply does not copy it, and close() unmaps the file right away
+class MappedFile:
+    def __init__(self, path):
+        self.fin = open(path, "rb")
+        try:
+            self.mapping = mapFile(self.fin)
+        except (OSError, ValueError):
+            self.fin.close()
+            raise
+        self.view = memoryview(self.mapping)
+
+    def readNumber(self, offset):
+        if offset + 4 > len(self.view):
+            return None
+        return struct.unpack_from("I", self.view, offset)[0]
+
+    # compare_digest() compares the buffers in C, while the equality of two memoryviews
+    # unpacks them one byte at a time
+    def equals(self, offset, other, otherOffset, size):
+        with self.view[offset:offset + size] as region, other.view[otherOffset:otherOffset + size] as otherRegion:
+            return len(region) == size and len(otherRegion) == size and hmac.compare_digest(region, otherRegion)
+
+    def close(self):
+        if self.view is None:
+            return
+        self.view.release()
+        self.view = None
+        if isinstance(self.mapping, mmap.mmap):
+            self.mapping.close()
+        self.fin.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_args):
+        self.close()
+
+# the shared memory of the solution, as seen through /dev/shm
+class ShmView(MappedFile):
+    def __init__(self, name):
+        MappedFile.__init__(self, getShmPath(name))
+
 class Tester(threading.Thread):
     MAX_SCORE = 10
 
-    PROT_READ = 1
-    PROT_WRITE = 2
-    MAP_SHARED = 1
-    O_RDONLY = 0
-
-    def __init__(self, data, name, params, checkMap):
+    # trace=False runs the solution without strace or the interposer, whatever TRACE_MODE is
+    def __init__(self, data, name, params, checkMap, trace=True):
         threading.Thread.__init__(self, daemon=True)
         print("\033[1;35mTesting %s...\033[0m" % name)
-        self._initIpc()
-        self.cmd = ["strace", "-o", "strace.log", "-e", "trace=open,openat,mmap,read", "./%s" % A3_PROG]
+        self.cmd = ["./%s" % A3_PROG]
+        self.env = None
+        if not trace:
+            pass
+        elif checkMap and TRACE_MODE == "preload":
+            self.env = dict(os.environ, LD_PRELOAD=os.path.abspath(TRACER_LIB),
+                            A3_TRACE_LOG=os.path.abspath(TRACE_LOG_FILE_NAME))
+        elif checkMap or TRACE_MODE == "strace":
+            self.cmd = ["strace", "-o", TRACE_LOG_FILE_NAME, "-e", "trace=%s" % ",".join(StraceAnalyzer.CALLS)] + self.cmd
         self.name = name
         self.params = params
         self.checkMap = checkMap
         self.timeLimit = TIME_LIMIT
         self.result = None
-        self.p = None
+        self.proc = None
         self.data = data
         self.score = 0
         self.fdCmd = None
         self.fdRes = None
+        self.codec = PipeCodec(data)
+        self.shm = None
         self.maxScore = Tester.MAX_SCORE
+        self.latencies = []
+        self.failures = 0
+        self.stressTime = 0
 
-    def _initIpc(self):
-        self.libc = ctypes.CDLL("libc.so.6")
+    def _removeShm(self):
         try:
-            self.librt = ctypes.CDLL("librt.so")
-        except OSError:
-            self.librt = ctypes.CDLL("librt.so.1")
-
-        self.shm_open = self.librt.shm_open
-        self.shm_open.argtypes = (ctypes.c_char_p, ctypes.c_int, ctypes.c_int)
-        self.shm_open.restype = ctypes.c_int
-
-        self.shm_unlink = self.librt.shm_unlink
-        self.shm_unlink.argtypes = (ctypes.c_char_p, )
-        self.shm_unlink.restype = ctypes.c_int
-
-        self.mmap = self.libc.mmap
-        self.mmap.argtypes = (ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_size_t)
-        self.mmap.restype = ctypes.c_void_p
-
-        self.munmap = self.libc.munmap
-        self.munmap.argtypes = (ctypes.c_void_p, ctypes.c_size_t)
-        self.munmap.restype = ctypes.c_int
+            os.remove(getShmPath(self.data["shm_name"]))
+        except FileNotFoundError:
+            pass
 
-    def _removeShm(self):
-        self.shm_unlink(self.data["shm_name"].encode())
+    # the shm stays mapped until the end of the test
+    def _openShm(self):
+        try:
+            self.shm = ShmView(self.data["shm_name"])
+        except FileNotFoundError:
+            print("[TESTER] shm with name %s not found" % self.data["shm_name"])
+            return False
+        return True
 
     def checkStrace(self):
-        rx = re.compile(rb"([a-z]+)\((.*)\)\s+=\s+([a-z0-9]+)")
-        fin = open("strace.log", "rb")
-        content = fin.read()
+        analyzer = StraceAnalyzer()
+        fin = open(TRACE_LOG_FILE_NAME, "rb")
+        for line in fin:
+            analyzer.feed(line)
         fin.close()
-        matches = rx.findall(content)
-        fds = {}
-        mappedFds = set()
-        readFds = set()
-        for (call, params, result) in matches:
-            params = params.split(b",")
-            if call == b"open":
-                fds[result] = params[0].strip()
-            elif call == b"openat":
-                fds[result] = params[1].strip()
-            elif call == b"read":
-                readFds.add(params[0].strip())
-            elif call == b"mmap":
-                mappedFds.add(params[4].strip())
-        for fd in readFds:
-            if (fd in fds) and (b"test_root" in fds[fd]):
-                print("[TESTER] read system call detected on file %s" % fds[fd])
-                return False
-        for fd, fname in fds.items():
-            if (b"test_root" in fname) and (fd not in mappedFds):
-                print("[TESTER] no mmap system call on file %s" % fds[fd])
-                return False
-        return True
+        return analyzer.finish()
 
-        
     def readNumber(self):
         if self.fdRes is None:
             return None
         try:
-            x = self.fdRes.read(4)
-            if len(x) != 4:
+            x = self.codec.readNumber()
+            if x is None:
                 return None
-            x = struct.unpack("I", x)[0]
             print("[TESTER] received number %u" % x)
             return x
         except IOError:
@@ -133,27 +605,10 @@ class Tester(threading.Thread):
         if self.fdRes is None:
             return None
         try:
-            if self.data["strings_size_first"]:
-                size = self.fdRes.read(1)
-                if len(size) != 1:
-                    return None
-                size = struct.unpack("B", size)[0]
-                s = self.fdRes.read(size)
-                if len(s) != size:
-                    return None
-                s = s.decode()
-            else:
-                s = []
-                while True:
-                    c = self.fdRes.read(1).decode()
-                    if len(c) != 1 or len(s) > 255:
-                        return None
-                    if c == self.data["strings_terminator"]:
-                        break
-                    else:
-                        s.append(c)
-                s = "".join(s)
-            print("[TESTER] received string '%s'" % s)
+            s = self.codec.readString()
+            if s is None:
+                return None
+            print("[TESTER] received string '%s'" % s.decode(errors="replace"))
             return s
         except IOError:
             self.fdRes = None
@@ -164,7 +619,7 @@ class Tester(threading.Thread):
             return None
         try:
             print("[TESTER] sending number %u" % nr)
-            self.fdCmd.write(struct.pack("I", nr))
+            self.fdCmd.write(self.codec.encodeNumber(nr))
             self.fdCmd.flush()
         except IOError:
             self.fdCmd = None
@@ -172,25 +627,17 @@ class Tester(threading.Thread):
     def writeString(self, s):
         if self.fdCmd is None:
             return None
-        if isinstance(s, bytes):
-            s = s.decode()
-        print("[TESTER] sending string '%s'" % s)
+        print("[TESTER] sending string '%s'" % (s.decode(errors="replace") if isinstance(s, bytes) else s))
         try:
-            if self.data["strings_size_first"]:
-                self.fdCmd.write(struct.pack("B", len(s)))
-                self.fdCmd.flush()
-            self.fdCmd.write(s.encode())
+            self.fdCmd.write(self.codec.encodeString(s))
             self.fdCmd.flush()
-            if not self.data["strings_size_first"]:
-                self.fdCmd.write(self.data["strings_terminator"].encode())
-                self.fdCmd.flush()
         except IOError:
             self.fdCmd = None
 
     def test_ping(self, _params):
         self.writeString(self.data["ping_command"][0])
         r = self.readString()
-        if r != self.data["ping_command"][0]:
+        if r != self.data["ping_command"][0].encode():
             return 0
         if self.data["ping_variant_first"]:
             var = self.readNumber()
@@ -198,7 +645,7 @@ class Tester(threading.Thread):
         else:
             resp = self.readString()
             var = self.readNumber()
-        if resp != self.data["ping_command"][1] or var != int(self.data["variant"]):
+        if resp != self.data["ping_command"][1].encode() or var != int(self.data["variant"]):
             return 0
         return self.maxScore
 
@@ -207,16 +654,13 @@ class Tester(threading.Thread):
         self.writeString("CREATE_SHM")
         self.writeNumber(int(self.data["shm_size"]))
         r = self.readString()
-        if r != "CREATE_SHM":
+        if r != b"CREATE_SHM":
             return 0
         r = self.readString()
-        if r != "SUCCESS":
+        if r != b"SUCCESS":
             return 0
         # check if the shm actually exists
-        #shm = self.shmget(int(self.data["shm_key"]), int(self.data["shm_size"]), 0)
-        shm = self.shm_open(self.data["shm_name"].encode(), Tester.O_RDONLY, 0)
-        if shm < 0:
-            print("[TESTER] shm with name %s not found" % self.data["shm_name"])
+        if not self._openShm():
             return 0
         return self.maxScore
 
@@ -226,31 +670,27 @@ class Tester(threading.Thread):
         self.writeString("CREATE_SHM")
         self.writeNumber(int(self.data["shm_size"]))
         r = self.readString()
-        if r != "CREATE_SHM":
+        if r != b"CREATE_SHM":
             return score
         r = self.readString()
-        if r != "SUCCESS":
+        if r != b"SUCCESS":
             return score
         # check if the shm actually exists
-        shm = self.shm_open(self.data["shm_name"].encode(), Tester.O_RDONLY, 0)
-        if shm < 0:
-            print("[TESTER] shm with name %s not found" % self.data["shm_name"])
+        if not self._openShm():
             return score
         score = 3
-        shmAddr = self.mmap(None, int(self.data["shm_size"]), Tester.PROT_READ, Tester.MAP_SHARED, shm, 0)
         self.writeString("WRITE_TO_SHM")
         self.writeNumber(int(self.data["shm_write_offset"]))
         self.writeNumber(int(self.data["shm_write_value"]))
         r = self.readString()
-        if r != "WRITE_TO_SHM":
+        if r != b"WRITE_TO_SHM":
             return score
         r = self.readString()
-        if r != "SUCCESS":
+        if r != b"SUCCESS":
             return score
-        val = ctypes.string_at(shmAddr + int(self.data["shm_write_offset"]), 4)
-        val = struct.unpack("I", val)[0]
+        val = self.shm.readNumber(int(self.data["shm_write_offset"]))
         if val != int(self.data["shm_write_value"]):
-            print("[TESTER] found %d value; expected: %s" % (val, self.data["shm_write_value"]))
+            print("[TESTER] found %s value; expected: %s" % (val, self.data["shm_write_value"]))
         else:
             score += 5
 
@@ -258,10 +698,10 @@ class Tester(threading.Thread):
         self.writeNumber(int(self.data["shm_size"])-2)
         self.writeNumber(0x12345678)
         r = self.readString()
-        if r != "WRITE_TO_SHM":
+        if r != b"WRITE_TO_SHM":
             return score
         r = self.readString()
-        if r != "ERROR":
+        if r != b"ERROR":
             return score
         score += 2
 
@@ -273,10 +713,10 @@ class Tester(threading.Thread):
         self.writeString("MAP_FILE")
         self.writeString(fname)
         r = self.readString()
-        if r != "MAP_FILE":
+        if r != b"MAP_FILE":
             return score
         r = self.readString()
-        if r != "ERROR":
+        if r != b"ERROR":
             return score
         return self.maxScore
 
@@ -286,10 +726,10 @@ class Tester(threading.Thread):
         self.writeString("MAP_FILE")
         self.writeString(fname)
         r = self.readString()
-        if r != "MAP_FILE":
+        if r != b"MAP_FILE":
             return score
         r = self.readString()
-        if r != "SUCCESS":
+        if r != b"SUCCESS":
             return score
         return self.maxScore
 
@@ -299,26 +739,23 @@ class Tester(threading.Thread):
         self.writeString("CREATE_SHM")
         self.writeNumber(int(self.data["shm_size"]))
         r = self.readString()
-        if r != "CREATE_SHM":
+        if r != b"CREATE_SHM":
             return score
         r = self.readString()
-        if r != "SUCCESS":
+        if r != b"SUCCESS":
             return score
         # check if the shm actually exists
-        shm = self.shm_open(self.data["shm_name"].encode(), Tester.O_RDONLY, 0)
-        if shm < 0:
-            print("[TESTER] shm with name %s not found" % self.data["shm_name"])
+        if not self._openShm():
             return score
-        shmAddr = self.mmap(None, int(self.data["shm_size"]), Tester.PROT_READ, Tester.MAP_SHARED, shm, 0)
         score = 2
 
         self.writeString("MAP_FILE")
         self.writeString(fname)
         r = self.readString()
-        if r != "MAP_FILE":
+        if r != b"MAP_FILE":
             return score
         r = self.readString()
-        if r != "SUCCESS":
+        if r != b"SUCCESS":
             return score
         score = 3
 
@@ -327,10 +764,10 @@ class Tester(threading.Thread):
         self.writeNumber(fsize + 1)
         self.writeNumber(50)
         r = self.readString()
-        if r != "READ_FROM_FILE_OFFSET":
+        if r != b"READ_FROM_FILE_OFFSET":
             return score
         r = self.readString()
-        if r != "ERROR":
+        if r != b"ERROR":
             return score
         score = 5
 
@@ -338,19 +775,17 @@ class Tester(threading.Thread):
         self.writeNumber(fsize//2)
         self.writeNumber(50)
         r = self.readString()
-        if r != "READ_FROM_FILE_OFFSET":
+        if r != b"READ_FROM_FILE_OFFSET":
             return score
         r = self.readString()
-        if r != "SUCCESS":
+        if r != b"SUCCESS":
             return score
         score = 6
 
         # check the read content
-        fin = open(fname, "rb")
-        content = fin.read()[fsize//2:fsize//2+50]
-        fin.close()
-        readContent = ctypes.string_at(shmAddr, 50)
-        if readContent != content:
+        with MappedFile(fname) as content:
+            correct = self.shm.equals(0, content, fsize//2, 50)
+        if not correct:
             print("[TESTER] read content incorrect")
         else:
             score = self.maxScore
@@ -363,26 +798,23 @@ class Tester(threading.Thread):
         self.writeString("CREATE_SHM")
         self.writeNumber(int(self.data["shm_size"]))
         r = self.readString()
-        if r != "CREATE_SHM":
+        if r != b"CREATE_SHM":
             return score
         r = self.readString()
-        if r != "SUCCESS":
+        if r != b"SUCCESS":
             return score
         # check if the shm actually exists
-        shm = self.shm_open(self.data["shm_name"].encode(), Tester.O_RDONLY, 0)
-        if shm < 0:
-            print("[TESTER] shm with name %s not found" % self.data["shm_name"])
+        if not self._openShm():
             return score
-        shmAddr = self.mmap(None, int(self.data["shm_size"]), Tester.PROT_READ, Tester.MAP_SHARED, shm, 0)
         score = 1
 
         self.writeString("MAP_FILE")
         self.writeString(fname)
         r = self.readString()
-        if r != "MAP_FILE":
+        if r != b"MAP_FILE":
             return score
         r = self.readString()
-        if r != "SUCCESS":
+        if r != b"SUCCESS":
             return score
         score = 2
 
@@ -392,35 +824,31 @@ class Tester(threading.Thread):
         self.writeNumber(0)
         self.writeNumber(100)
         r = self.readString()
-        if r != "READ_FROM_FILE_SECTION":
+        if r != b"READ_FROM_FILE_SECTION":
             return score
         r = self.readString()
-        if r != "ERROR":
+        if r != b"ERROR":
             return score
         score = 4
 
-        fin = open(fname, "rb")
-        content = fin.read()
-        fin.close()
-
         sectIds = random.sample(range(len(sections)), 3)
         for sectId in sectIds:
             _name, _type, offset, size = sections[sectId]
             readOffset = random.randint(0, size//2)
             readSize = random.randint(5, size//2)
-            expectedContent = content[offset + readOffset : offset + readOffset + readSize]
             self.writeString("READ_FROM_FILE_SECTION")
             self.writeNumber(sectId+1)
             self.writeNumber(readOffset)
             self.writeNumber(readSize)
             r = self.readString()
-            if r != "READ_FROM_FILE_SECTION":
+            if r != b"READ_FROM_FILE_SECTION":
                 return score
             r = self.readString()
-            if r != "SUCCESS":
+            if r != b"SUCCESS":
                 return score
-            readContent = ctypes.string_at(shmAddr, readSize)
-            if readContent != expectedContent:
+            with MappedFile(fname) as content:
+                correct = self.shm.equals(0, content, offset + readOffset, readSize)
+            if not correct:
                 print("[TESTER] read content incorrect")
             else:
                 score += 2
@@ -432,33 +860,26 @@ class Tester(threading.Thread):
         self.writeString("CREATE_SHM")
         self.writeNumber(int(self.data["shm_size"]))
         r = self.readString()
-        if r != "CREATE_SHM":
+        if r != b"CREATE_SHM":
             return score
         r = self.readString()
-        if r != "SUCCESS":
+        if r != b"SUCCESS":
             return score
         # check if the shm actually exists
-        shm = self.shm_open(self.data["shm_name"].encode(), Tester.O_RDONLY, 0)
-        if shm < 0:
-            print("[TESTER] shm with name %s not found" % self.data["shm_name"])
+        if not self._openShm():
             return score
-        shmAddr = self.mmap(None, int(self.data["shm_size"]), Tester.PROT_READ, Tester.MAP_SHARED, shm, 0)
         score = 1
 
         self.writeString("MAP_FILE")
         self.writeString(fname)
         r = self.readString()
-        if r != "MAP_FILE":
+        if r != b"MAP_FILE":
             return score
         r = self.readString()
-        if r != "SUCCESS":
+        if r != b"SUCCESS":
             return score
         score = 2
 
-        fin = open(fname, "rb")
-        content = fin.read()
-        fin.close()
-
         rawSections = getSectionsTable(self.data, fname)
         sectIds = random.sample(range(len(rawSections)), 4)
         crtOffset = 0
@@ -468,78 +889,136 @@ class Tester(threading.Thread):
             if sectId in sectIds:
                 readOffset = random.randint(0, size//2)
                 readSize = random.randint(5, size//2)
-                expectedContent = content[offset + readOffset : offset + readOffset + readSize]
-                toRead.append((crtOffset + readOffset, readSize, expectedContent))
+                toRead.append((crtOffset + readOffset, readSize, offset + readOffset))
             crtOffset += ((size + align - 1) // align) * align
 
-        for (logicOffset, size, expectedContent) in toRead:
+        for (logicOffset, size, fileOffset) in toRead:
             self.writeString("READ_FROM_LOGICAL_SPACE_OFFSET")
             self.writeNumber(logicOffset)
             self.writeNumber(size)
             r = self.readString()
-            if r != "READ_FROM_LOGICAL_SPACE_OFFSET":
+            if r != b"READ_FROM_LOGICAL_SPACE_OFFSET":
                 return score
             r = self.readString()
-            if r != "SUCCESS":
+            if r != b"SUCCESS":
                 return score
-            readContent = ctypes.string_at(shmAddr, size)
-            if readContent != expectedContent:
+            with MappedFile(fname) as content:
+                correct = self.shm.equals(0, content, fileOffset, size)
+            if not correct:
                 print("[TESTER] read content incorrect")
             else:
                 score += 2
         return score
 
-    def run(self):
-        if os.path.exists(self.data["pipeCmd"]):
-            os.remove(self.data["pipeCmd"])
-        if os.path.exists(self.data["pipeRes"]):
-            os.remove(self.data["pipeRes"])
-        os.mkfifo(self.data["pipeCmd"], 0o644)
+    def test_stress(self, params):
+        fname, requests = params
+        self._removeShm()
+        self.writeString("CREATE_SHM")
+        self.writeNumber(int(self.data["shm_size"]))
+        r = self.readString()
+        if r != b"CREATE_SHM":
+            return 0
+        r = self.readString()
+        if r != b"SUCCESS":
+            return 0
+        self.writeString("MAP_FILE")
+        self.writeString(fname)
+        r = self.readString()
+        if r != b"MAP_FILE":
+            return 0
+        r = self.readString()
+        if r != b"SUCCESS":
+            return 0
+        if not self._openShm():
+            return 0
 
-        if VERBOSE:
-            self.p = subprocess.Popen(self.cmd)
-        else:
-            self.p = subprocess.Popen(self.cmd, stdout=open(os.devnull, "w"), stderr=open(os.devnull, "w"))
+        content = MappedFile(fname)
+        startTime = time.perf_counter()
+        try:
+            for command, numbers, expected in requests:
+                t1 = time.perf_counter()
+                self.writeString(command)
+                for nr in numbers:
+                    self.writeNumber(nr)
+                r = self.readString()
+                status = self.readString()
+                latency = time.perf_counter() - t1
+                if r != command.encode() or status not in (b"SUCCESS", b"ERROR"):
+                    # the protocol is broken, so the remaining requests fail as well
+                    self.failures += len(requests) - len(self.latencies)
+                    break
+                self.latencies.append(latency)
+                if expected is None:
+                    correct = status == b"ERROR"
+                else:
+                    offset, size = expected
+                    correct = status == b"SUCCESS" and self.shm.equals(0, content, offset, size)
+                if not correct:
+                    self.failures += 1
+        finally:
+            self.stressTime = time.perf_counter() - startTime
+            content.close()
+        return self.maxScore * (len(requests) - self.failures) // len(requests)
+
+    def run(self):
         # wait for the response pipe creation
         self.fdCmd = open(self.data["pipeCmd"], "wb")
         try:
-            self.fdRes = open(self.data["pipeRes"], "rb")
+            self.fdRes = open(self.data["pipeRes"], "rb", buffering=0)
+            self.codec.attach(self.fdRes)
         except FileNotFoundError:
             print("[TESTER] could not open response pipe")
 
         #wait for the CONNECT message
         s = self.readString()
-        if s == self.data["connect_string"]:
+        if s == self.data["connect_string"].encode():
             self.score += 1
             sc = getattr(self, "test_" + self.name)(self.params)
             if sc > self.score:
                 self.score = sc
             self.writeString("EXIT")
-            self.p.wait()
         else:
-            self.p.kill()
-            self.p = None
+            self.proc.kill()
 
+        if self.shm is not None:
+            self.shm.close()
         if self.fdRes is not None:
             self.fdRes.close()
-        if os.path.exists(self.data["pipeRes"]):
-            os.remove(self.data["pipeRes"])
         if self.fdCmd is not None:
             self.fdCmd.close()
-        if os.path.exists(self.data["pipeCmd"]):
-            os.remove(self.data["pipeCmd"])
 
-    def perform(self):
-        timeout = False
-        self.start()
-        self.join(TIME_LIMIT)
+    # opening a pipe in read-write mode never blocks and wakes up
+    # a protocol thread that still waits for the other end of the pipe
+    def unblockPipes(self):
+        for pipe in (self.data["pipeCmd"], self.data["pipeRes"]):
+            try:
+                fd = os.open(pipe, os.O_RDWR | os.O_NONBLOCK)
+                os.close(fd)
+            except OSError:
+                pass
 
+    def removePipes(self):
+        for pipe in (self.data["pipeCmd"], self.data["pipeRes"]):
+            if os.path.exists(pipe):
+                os.remove(pipe)
+
+    def perform(self):
+        self.removePipes()
+        os.mkfifo(self.data["pipeCmd"], 0o644)
+        if self.env is not None:
+            # the interposer only appends to the log
+            open(TRACE_LOG_FILE_NAME, "w").close()
+        self.proc = TestProcess(self.cmd, self.timeLimit, quiet=not VERBOSE, env=self.env)
+        # the protocol thread starts only after the process exists, so that it can kill it
+        runProcesses([self.proc], onStart=lambda _proc: self.start())
         if self.is_alive():
-            if self.p is not None:
-                self.p.kill()
-                timeout = True
-            #self.join()
-        if timeout:
+            self.join(POLL_INTERVAL)
+        while self.is_alive():
+            self.unblockPipes()
+            self.join(POLL_INTERVAL)
+        self.removePipes()
+
+        if self.proc.timeout:
             print("\t\033[1;31mTIME LIMIT EXCEEDED\033[0m")
             return 0, self.maxScore
         if self.checkMap:
@@ -547,10 +1026,17 @@ class Tester(threading.Thread):
                 self.score *= 0.7
         return self.score, self.maxScore
 
+# version 1 draws every symbol with its own random.randint() call and reproduces
+# the already published test files; version 2 draws all the symbols at once
+GENERATOR_VERSION = 1
+NAME_SYMBOLS = b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijlmnopqrstuvwxyz1234567890"
+
 def genRandomName(length=0):
     symbols = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijlmnopqrstuvwxyz1234567890"
     if length == 0:
         length = random.randint(4, 10)
+    if GENERATOR_VERSION >= 2:
+        return bytes(random.choices(NAME_SYMBOLS, k=length))
     name = [symbols[random.randint(0, len(symbols)-1)] for _i in range(length)]
     return "".join(name).encode()
 
@@ -621,13 +1107,28 @@ def genSectionFile(path, data):
     perm = (4+random.randint(0, 3)) * 64 + random.randint(0, 7) * 8 + random.randint(0, 7)
     os.chmod(path, perm)
 
-def getSectionsTable(data, fpath):
-    if not os.path.isfile(fpath):
-        return None
-    fin = open(fpath, "rb")
-    content = fin.read()
-    fin.close()
+SECTION_STRUCTS = {}
+
+def getSectionStructs(data):
+    key = (data["version_size"], data["section_name_size"], data["section_type_size"])
+    if key not in SECTION_STRUCTS:
+        formats = {"1": "B", "2": "H"}
+        versionFormat = formats.get(data["version_size"], "I")
+        typeFormat = formats.get(data["section_type_size"], "I")
+        SECTION_STRUCTS[key] = (struct.Struct("=%sB" % versionFormat),
+                                struct.Struct("=%ds%sII" % (int(data["section_name_size"]), typeFormat)))
+    return SECTION_STRUCTS[key]
 
+def mapFile(fin):
+    if os.fstat(fin.fileno()).st_size == 0:
+        return b""
+    return mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ)
+
+def getShmPath(name):
+    return os.path.join(SHM_DIR, name.lstrip("/"))
+
+# only the header region of the file is copied
+def readSectionTable(data, content):
     magicSize = int(data["magic_size"])
     if data["header_pos_end"]:
         magic = content[-magicSize:]
@@ -641,43 +1142,32 @@ def getSectionsTable(data, fpath):
     else:
         hdrSize = struct.unpack("H", content[magicSize:magicSize+2])[0]
         hdr = content[magicSize+2:hdrSize]
-    if data["version_size"] == "1":
-        version = struct.unpack("B", hdr[0:1])[0]
-        nrSect = struct.unpack("B", hdr[1:2])[0]
-        hdr = hdr[2:]
-    elif data["version_size"] == "2":
-        version = struct.unpack("H", hdr[:2])[0]
-        nrSect = struct.unpack("B", hdr[2:3])[0]
-        hdr = hdr[3:]
-    else:
-        version = struct.unpack("I", hdr[:4])[0]
-        nrSect = struct.unpack("B", hdr[4:5])[0]
-        hdr = hdr[5:]
+    hdrStruct, sectStruct = getSectionStructs(data)
+    version, nrSect = hdrStruct.unpack_from(hdr)
     if version < int(data["version_min"]) or version > int(data["version_max"]):
         return None
     if nrSect < int(data["nr_sect_min"]) or nrSect > int(data["nr_sect_max"]):
         return None
-    ns = int(data["section_name_size"])
-    ts = int(data["section_type_size"])
-    sectSize = ns + ts + 4 + 4
     sections = []
     for i in range(nrSect):
-        name = hdr[i*sectSize:i*sectSize+ns]
-        name = name.replace(b"\x00", b"")
-        type = hdr[i*sectSize+ns:i*sectSize+ns+ts]
-        if ts == 1:
-            type = struct.unpack("B", type)[0]
-        elif ts == 2:
-            type = struct.unpack("H", type)[0]
-        else:
-            type = struct.unpack("I", type)[0]
+        name, type, offset, size = sectStruct.unpack_from(hdr, hdrStruct.size + i * sectStruct.size)
         if str(type) not in data["section_types"]:
             return None
-        offset = struct.unpack("I", hdr[i*sectSize+ns+ts:i*sectSize+ns+ts+4])[0]
-        size = struct.unpack("I", hdr[i*sectSize+ns+ts+4:i*sectSize+ns+ts+8])[0]
-        sections.append((name, type, offset, size))
+        sections.append((name.replace(b"\x00", b""), type, offset, size))
     return sections
 
+def getSectionsTable(data, fpath):
+    if not os.path.isfile(fpath):
+        return None
+    fin = open(fpath, "rb")
+    content = mapFile(fin)
+    try:
+        return readSectionTable(data, content)
+    finally:
+        if isinstance(content, mmap.mmap):
+            content.close()
+        fin.close()
+
 def loadTests(data):
     random.seed(data["name"])
     tests = [("ping", None, False), 
@@ -697,6 +1187,129 @@ def loadTests(data):
 
     return tests
 
+def loadData():
+    with open("a3_data.json") as a3_data:
+        content = a3_data.read()
+        decoded_data = base64.b64decode(content).decode('utf-8')
+        return json.loads(decoded_data)
+
+# the interposer is rebuilt only when it is older than its source
+# without its source, an existing a3_trace.so is used as it is
+def buildTracer():
+    if not os.path.isfile(TRACER_SOURCE):
+        return os.path.isfile(TRACER_LIB)
+    if os.path.isfile(TRACER_LIB) and os.path.getmtime(TRACER_LIB) >= os.path.getmtime(TRACER_SOURCE):
+        return True
+    subprocess.call(["gcc", "-Wall", "-shared", "-fPIC", "-O2", "-o", TRACER_LIB, TRACER_SOURCE, "-ldl"],
+                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return os.path.isfile(TRACER_LIB)
+
+def saveResults(compileRes, score, maxScore, result, testResults):
+    with open(RESULTS_FILE_NAME, "w") as fout:
+        json.dump({"compile": compileRes, "score": score, "max_score": maxScore, "grade": result,
+                    "tests": testResults}, fout, indent=4)
+
+def grade(data, tests, compileRes):
+    if compileRes == 0:
+        print("COMPILATION ERROR")
+        saveResults(compileRes, 0, 0, 0.0, [])
+        return 0, 0, 0.0
+    global TRACE_MODE
+    if TRACE_MODE == "preload" and not buildTracer():
+        print("\033[1;31mCould not build %s, strace will be used instead.\033[0m" % TRACER_LIB)
+        TRACE_MODE = "checkmap"
+    score = 0
+    maxScore = 0
+    testResults = []
+    for name, params, checkMap in tests:
+        tester = Tester(data, name, params, checkMap)
+        testScore, testMaxScore = tester.perform()
+        print("Test score: %d / %d" % (testScore, testMaxScore))
+        score += testScore
+        maxScore += testMaxScore
+        testResults.append(getTestResult(name, testScore, testMaxScore, tester.proc))
+    print("\nTotal score: %d / %d" % (score, maxScore))
+    result = 100.0 * score / maxScore
+    if compileRes == 1:
+        print("\033[1;31mThere were some compilation warnings. A 10% penalty will be applied.\033[0m")
+        result = result * 0.9
+    print("Assignment grade: %.2f / 100" % result)
+    saveResults(compileRes, score, maxScore, result, testResults)
+    return score, maxScore, result
+
+# the requests are (command, numbers, expected) tuples; expected is the (offset, size)
+# of the file region the reply must copy in the shm, or None if the reply must be ERROR;
+# they depend only on the test data and count, so that a failure can be reproduced
+def genStressRequests(data, fpath, count):
+    rng = random.Random("%s_stress_%d" % (data["name"], count))
+    fsize = os.path.getsize(fpath)
+    sections = getSectionsTable(data, fpath)
+    align = int(data["logical_space_section_alignment"])
+    logicalOffsets = []
+    logicalSize = 0
+    for _name, _type, _offset, size in sections:
+        logicalOffsets.append(logicalSize)
+        logicalSize += ((size + align - 1) // align) * align
+    # an empty section has no region to read
+    sectIds = [sectId for sectId, (_name, _type, _offset, size) in enumerate(sections) if size > 0]
+    requests = []
+    for _i in range(count):
+        command = rng.choice(STRESS_COMMANDS)
+        inRange = rng.random() >= STRESS_ERROR_RATIO
+        sectId = rng.choice(sectIds)
+        _name, _type, offset, size = sections[sectId]
+        maxReadSize = max(1, size//2)
+        readOffset = rng.randint(0, size//2)
+        readSize = rng.randint(min(5, maxReadSize), maxReadSize)
+        if command == "READ_FROM_FILE_OFFSET":
+            numbers = (offset + readOffset if inRange else fsize + readOffset, readSize)
+        elif command == "READ_FROM_FILE_SECTION":
+            numbers = (sectId + 1 if inRange else len(sections) + 1 + sectId, readOffset, readSize)
+        else:
+            numbers = (logicalOffsets[sectId] + readOffset if inRange else logicalSize + readOffset, readSize)
+        requests.append((command, numbers, (offset + readOffset, readSize) if inRange else None))
+    return requests
+
+def percentile(values, p):
+    i = (p * len(values) + 99) // 100 - 1
+    return values[min(len(values) - 1, max(0, i))]
+
+# the stress run is never traced, so that the latencies are those of the solution, not of ptrace
+def makeStressTester(data, tests, count):
+    fname = [params for name, params, _checkMap in tests if name == "read_logical"][0]
+    tester = Tester(data, "stress", (fname, genStressRequests(data, fname, count)), False, trace=False)
+    tester.timeLimit = TIME_LIMIT + count * STRESS_REQUEST_TIME
+    return tester
+
+# measures how fast the solution answers many READ_FROM_* requests on the file of the
+# read_logical test; the messages of the protocol are not displayed
+def stressTest(data, tests, compileRes, count):
+    if compileRes == 0:
+        print("COMPILATION ERROR")
+        saveResults(compileRes, 0, 0, 0.0, [])
+        return
+    tester = makeStressTester(data, tests, count)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        score, maxScore = tester.perform()
+    testResult = getTestResult("stress", score, maxScore, tester.proc)
+    latencies = sorted(tester.latencies)
+    testResult.update({"requests": count, "answered": len(latencies), "incorrect": tester.failures})
+    if tester.proc.timeout:
+        print("\t\033[1;31mTIME LIMIT EXCEEDED\033[0m")
+    if len(latencies) == 0:
+        print("\t\033[1;31mNo request was answered\033[0m")
+    else:
+        testResult["throughput"] = len(latencies) / tester.stressTime
+        for p in PERCENTILES:
+            testResult["p%d_ms" % p] = 1000 * percentile(latencies, p)
+        testResult["max_ms"] = 1000 * latencies[-1]
+        print("\t%d requests, %d answered, %d incorrect" % (count, len(latencies), tester.failures))
+        print("\tThroughput: %.1f requests/s" % testResult["throughput"])
+        print("\tLatency: %s, max %.3f ms" % (", ".join("p%d %.3f ms" % (p, testResult["p%d_ms" % p])
+                                                            for p in PERCENTILES), testResult["max_ms"]))
+    print("Stress score: %d / %d" % (score, maxScore))
+    saveResults(compileRes, score, maxScore, 100.0 * score / maxScore, [testResult])
+
 class DockerHelper:
     _REPO_NAME = "coprisa/utcn-os"
     _TAG_NAME = "os-hw"
@@ -733,13 +1346,21 @@ class DockerHelper:
         return res.output.decode("utf-8", "ignore")
 
     def copyCompileLogFileInCurrentDirectory(self):
-        stream, _stat = self.container.get_archive(posixpath.join(DockerHelper._WORKING_DIR, COMPILE_LOG_FILE_NAME))
+        self.copyFileInCurrentDirectory(COMPILE_LOG_FILE_NAME)
+
+    # returns False if the file does not exist in the container
+    def copyFileInCurrentDirectory(self, fname):
+        try:
+            stream, _stat = self.container.get_archive(posixpath.join(DockerHelper._WORKING_DIR, fname))
+        except docker.errors.NotFound:
+            return False
         file_obj = io.BytesIO()
         for c in stream:
             file_obj.write(c)
         file_obj.seek(0)
         tar = tarfile.open(mode="r", fileobj=file_obj)
         tar.extractall(".")
+        return True
 
 def main():
     parser = argparse.ArgumentParser(prog="tester.py")
@@ -752,6 +1373,20 @@ def main():
     parser.add_argument("-v", "--verbose", 
         action = "store_true",
         help = "Displays more details.")
+    parser.add_argument("-g", "--generator",
+        type = int,
+        choices = (1, 2),
+        default = 1,
+        help = "Version of the random generator used for the test files (1 reproduces the published ones).")
+    parser.add_argument("-t", "--trace",
+        choices = ("strace", "checkmap", "preload"),
+        default = "strace",
+        help = "Tracing of the system calls: strace for every test, strace only for the tests that check mmap, or an LD_PRELOAD interposer for those tests.")
+    parser.add_argument("-s", "--stress",
+        type = int,
+        default = 0,
+        metavar = "N",
+        help = "Sends N random READ_FROM_* requests and reports the throughput and latency of the solution, instead of grading it.")
     args = parser.parse_args()
 
     if args.docker or args.docker_persist:
@@ -761,6 +1396,10 @@ def main():
         containerArgs = []
         if args.verbose:
             containerArgs.append("-v")
+        containerArgs += ["-g", str(args.generator), "-t", args.trace, "-s", str(args.stress)]
+        # a results file left by an earlier run must not pass for the results of this one
+        if os.path.isfile(RESULTS_FILE_NAME):
+            os.remove(RESULTS_FILE_NAME)
         dh = DockerHelper()
         dh.runContainer()
         dh.copyDir(".")
@@ -769,6 +1408,8 @@ def main():
         logFile.write(res)
         logFile.close()
         dh.copyCompileLogFileInCurrentDirectory()
+        if not dh.copyFileInCurrentDirectory(RESULTS_FILE_NAME):
+            print("\033[1;31mThe tests did not write %s.\033[0m" % RESULTS_FILE_NAME)
         print(res)
         if args.docker_persist:
             containerId = dh.getContainerId()
@@ -780,35 +1421,17 @@ def main():
             except docker.errors.APIError:
                 print("Could not remove docker container.")
     else:
+        global VERBOSE, GENERATOR_VERSION, TRACE_MODE
         if args.verbose:
-            global VERBOSE
             VERBOSE = True
+        GENERATOR_VERSION = args.generator
+        TRACE_MODE = args.trace
         compileRes = compile()
-        if compileRes == 0:
-            print("COMPILATION ERROR")
+        data = loadData()
+        if args.stress > 0:
+            stressTest(data, loadTests(data), compileRes, args.stress)
         else:
-            score = 0
-            with open("a3_data.json") as a3_data:
-                content = a3_data.read()
-                decoded_data = base64.b64decode(content).decode('utf-8')
-                data = json.loads(decoded_data)
-
-            tests = loadTests(data)
-
-            score = 0
-            maxScore = 0
-            for name, params, checkMap in tests:
-                tester = Tester(data, name, params, checkMap)
-                testScore, testMaxScore = tester.perform()
-                print("Test score: %d / %d" % (testScore, testMaxScore))
-                score += testScore
-                maxScore += testMaxScore
-            print("\nTotal score: %d / %d" % (score, maxScore))
-            score = 100.0 * score / maxScore
-            if compileRes == 1:
-                print("\033[1;31mThere were some compilation warnings. A 10% penalty will be applied.\033[0m")
-                score = score * 0.9
-            print("Assignment grade: %.2f / 100" % score)
+            grade(data, loadTests(data), compileRes)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+import os, sys, csv, shutil, contextlib, importlib.util
+import concurrent.futures
+import argparse
+
+ASSIGNMENTS = ("a1", "a2", "a3")
+# files from the assignment directory that each submission needs to compile
+HELPER_FILES = {
+    "a1": [],
+    "a2": ["a2_helper.c", "a2_helper.h", "a2_helper.o", "a2_helper.o.key"],
+    "a3": ["a3_trace.c", "a3_trace.so"],
+}
+FIXTURE_DIR_NAME = "test_root"
+# a3 uses fixed pipe and shm names, so its submissions are graded one at a time
+PARALLEL_GRADING = ("a1", "a2")
+COMPILE_RESULTS = {0: "error", 1: "warnings", 2: "ok"}
+
+tester = None
+
+def loadTester(assignment):
+    global tester
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), assignment, "tester.py")
+    spec = importlib.util.spec_from_file_location("%s_tester" % assignment, path)
+    tester = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(tester)
+    return tester
+
+def buildFixtures(assignment, assignmentDir):
+    # the fixtures are built only once, in the assignment directory
+    crtDir = os.getcwd()
+    os.chdir(assignmentDir)
+    try:
+        if assignment == "a1":
+            if os.path.isfile("tests.json") and not os.path.isdir(FIXTURE_DIR_NAME):
+                # a tests.json without its test_root cannot be graded, the fixtures are built again
+                os.remove("tests.json")
+            return None, tester.loadTests()
+        data = tester.loadData()
+        if assignment == "a2":
+            # the helper object is built once and copied to every submission
+            tester.buildHelper()
+        if assignment == "a3":
+            return data, tester.loadTests(data)
+        return data, None
+    finally:
+        os.chdir(crtDir)
+
+# the grader's helper files replace whatever the submission shipped under the same names
+def prepareSubmission(assignment, assignmentDir, subDir):
+    for fname in HELPER_FILES[assignment]:
+        src = os.path.join(assignmentDir, fname)
+        dst = os.path.join(subDir, fname)
+        if os.path.isfile(src):
+            shutil.copy2(src, dst)
+        elif os.path.isfile(dst):
+            os.remove(dst)
+    # every submission gets its own real copy of the fixtures, as when the tester runs alone,
+    # in place of any test_root it already had
+    fixture = os.path.join(assignmentDir, FIXTURE_DIR_NAME)
+    dst = os.path.join(subDir, FIXTURE_DIR_NAME)
+    if os.path.islink(dst) or os.path.isfile(dst):
+        os.remove(dst)
+    elif os.path.isdir(dst):
+        shutil.rmtree(dst)
+    if os.path.isdir(fixture):
+        shutil.copytree(fixture, dst, symlinks=True)
+
+def compileSubmission(subDir):
+    os.chdir(subDir)
+    return tester.compile()
+
+def gradeSubmission(assignment, subDir, outPath, data, tests, compileRes):
+    os.chdir(subDir)
+    with open(outPath, "w") as fout, contextlib.redirect_stdout(fout):
+        if assignment == "a1":
+            return tester.grade(tests, compileRes)
+        elif assignment == "a2":
+            return tester.grade(data, compileRes)
+        else:
+            return tester.grade(data, tests, compileRes)
+
+def main():
+    parser = argparse.ArgumentParser(prog="batch_grade.py")
+    parser.add_argument("assignment",
+        choices = ASSIGNMENTS,
+        help = "The assignment to grade.")
+    parser.add_argument("submissions",
+        help = "Directory with one subdirectory for each student submission.")
+    parser.add_argument("-o", "--output",
+        default = "batch_results",
+        help = "Directory for the per-student results and the summary CSV.")
+    parser.add_argument("-j", "--jobs",
+        type = int,
+        default = 0,
+        help = "Number of worker processes (0 uses all the CPUs).")
+    parser.add_argument("-g", "--generator",
+        type = int,
+        choices = (1, 2),
+        default = 1,
+        help = "Version of the random generator used for the test fixtures.")
+    args = parser.parse_args()
+
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    assignmentDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), args.assignment)
+    outDir = os.path.abspath(args.output)
+    os.makedirs(outDir, exist_ok=True)
+    students = sorted(name for name in os.listdir(args.submissions)
+                        if os.path.isdir(os.path.join(args.submissions, name)))
+    if len(students) == 0:
+        print("No submissions found in %s" % args.submissions)
+        sys.exit()
+    subDirs = [os.path.abspath(os.path.join(args.submissions, name)) for name in students]
+
+    loadTester(args.assignment)
+    if args.assignment != "a2":
+        tester.GENERATOR_VERSION = args.generator
+    print("Building the test fixtures...")
+    data, tests = buildFixtures(args.assignment, assignmentDir)
+    for subDir in subDirs:
+        prepareSubmission(args.assignment, assignmentDir, subDir)
+
+    print("Compiling %d submissions..." % len(subDirs))
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs, initializer=loadTester,
+                                                    initargs=(args.assignment, )) as pool:
+        compileResults = list(pool.map(compileSubmission, subDirs))
+
+    gradeJobs = jobs if args.assignment in PARALLEL_GRADING else 1
+    results = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=gradeJobs, initializer=loadTester,
+                                                    initargs=(args.assignment, )) as pool:
+        futures = []
+        for student, subDir, compileRes in zip(students, subDirs, compileResults):
+            outPath = os.path.join(outDir, "%s.txt" % student)
+            futures.append(pool.submit(gradeSubmission, args.assignment, subDir, outPath,
+                                        data, tests, compileRes))
+        for student, compileRes, future in zip(students, compileResults, futures):
+            score, maxScore, grade = future.result()
+            print("%s: %.2f / 100" % (student, grade))
+            results.append([student, COMPILE_RESULTS[compileRes], score, maxScore, "%.2f" % grade])
+
+    with open(os.path.join(outDir, "summary.csv"), "w", newline="") as fout:
+        writer = csv.writer(fout)
+        writer.writerow(["student", "compile", "score", "max_score", "grade"])
+        writer.writerows(results)
+    print("Results saved in %s" % outDir)
+
+if __name__ == "__main__":
+    main()
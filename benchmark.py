@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+import os, sys, json, time, math, random, shutil, tempfile, platform, base64, importlib.util
+import argparse
+
+ASSIGNMENTS = ("a1", "a2", "a3")
+# scale 1 matches the fixtures of the real tests; larger scales multiply the files and threads
+SCALES = (1, 10, 100)
+QUERIES = 50
+ROUNDS = 20
+PERCENTILES = (50, 90, 99)
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def loadTester(assignment):
+    path = os.path.join(REPO_DIR, assignment, "tester.py")
+    spec = importlib.util.spec_from_file_location("%s_tester" % assignment, path)
+    tester = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(tester)
+    return tester
+
+def loadData(assignment):
+    with open(os.path.join(REPO_DIR, assignment, "%s_data.json" % assignment)) as fin:
+        return json.loads(base64.b64decode(fin.read()).decode("utf-8"))
+
+def percentile(latencies, p):
+    i = int(math.ceil(p / 100.0 * len(latencies))) - 1
+    return latencies[min(len(latencies) - 1, max(0, i))]
+
+# latencies are in seconds; items is the amount of work done by all the operations
+def summarize(latencies, items):
+    total = sum(latencies)
+    latencies = sorted(latencies)
+    summary = {"ops": len(latencies), "items": items,
+                "throughput": items / total if total > 0 else 0.0}
+    for p in PERCENTILES:
+        summary["p%d_ms" % p] = percentile(latencies, p) * 1000
+    return summary
+
+def measure(ops, itemsPerOp=1):
+    latencies = []
+    for op in ops:
+        t1 = time.perf_counter()
+        op()
+        latencies.append(time.perf_counter() - t1)
+    return summarize(latencies, itemsPerOp * len(latencies))
+
+def benchA1(tester, data, scale):
+    results = {}
+    random.seed("a1_%d" % scale)
+    dirs = tester.makeRandomDirs(b"test_root", 100 * scale)
+    files = []
+    latencies = []
+    for _i in range(200 * scale):
+        fpath = os.path.join(random.choice(dirs), b"%s.%s" % (tester.genRandomName(), tester.genRandomName(3)))
+        while fpath in files:
+            fpath += tester.genRandomName(1)
+        files.append(fpath)
+        t1 = time.perf_counter()
+        tester.genSectionFile(fpath, data)
+        latencies.append(time.perf_counter() - t1)
+    results["a1.genSectionFile"] = summarize(latencies, len(latencies))
+
+    sampleFiles = [random.choice(files) for _i in range(QUERIES)]
+    sampleDirs = [random.choice(dirs) for _i in range(QUERIES)]
+    results["a1.parseFile"] = measure([lambda f=f: tester.parseFile(data, f) for f in sampleFiles])
+
+    listCmds = [["list", "recursive", "path=%s" % d.decode()] for d in sampleDirs]
+    findallCmds = [["findall", "path=%s" % d.decode()] for d in sampleDirs]
+    results["a1.list"] = measure([lambda cmd=cmd: tester.perform_a1(data, cmd) for cmd in listCmds])
+    # the plain series parses every file, without any section index
+    results["a1.findall"] = measure([lambda cmd=cmd: tester.perform_a1(data, cmd, sectionIndexPath=None)
+                                        for cmd in findallCmds])
+
+    indexes = []
+    results["a1.FsIndex"] = measure([lambda: indexes.append(tester.FsIndex(data, dirs[0]))
+                                        for _i in range(3)], len(dirs) + len(files))
+    index = indexes[-1]
+    results["a1.list_index"] = measure([lambda cmd=cmd: tester.perform_a1(data, cmd, index) for cmd in listCmds])
+    # the section index is written next to the fixtures, in the temporary work directory
+    sectionIndex = tester.SectionIndex(data, tester.getSectionIndexPath(dirs[0]))
+    index = tester.FsIndex(data, dirs[0], sectionIndex)
+    results["a1.findall_index"] = measure([lambda cmd=cmd: tester.perform_a1(data, cmd, index) for cmd in findallCmds])
+    return results
+
+# the threads of the barrier process start and end in groups of threads2_max
+def genBarrierMessages(data, count):
+    procNr = int(data["threads2_proc"])
+    maxThreads = int(data["threads2_max"])
+    pid = 1000
+    msgs = [(1, procNr, 0, pid, 1, pid)]
+    for first in range(1, count + 1, maxThreads):
+        group = range(first, min(count, first + maxThreads - 1) + 1)
+        for th in group:
+            msgs.append((1, procNr, th, pid, 1, pid + th))
+        for th in group:
+            msgs.append((2, procNr, th, pid, 1, pid + th))
+    msgs.append((2, procNr, 0, pid, 1, pid))
+    return msgs
+
+def benchA2(tester, data, scale):
+    results = {}
+    count = int(data["threads2_count"]) * scale
+    data = dict(data, threads2_count=str(count))
+    msgs = genBarrierMessages(data, count)
+    server = tester.Server()
+    def addAll():
+        server.reset()
+        for msg in msgs:
+            server.addInfo(msg)
+    try:
+        results["a2.addInfo"] = measure([addAll] * ROUNDS, len(msgs))
+        infos = server.infos
+    finally:
+        server.selector.close()
+        server.servSocket.close()
+        server.wakeSocket.close()
+        server.stopSocket.close()
+        if server.socketPath is not None:
+            shutil.rmtree(os.path.dirname(server.socketPath), ignore_errors=True)
+    results["a2.checkThreads2"] = measure([lambda: tester.checkThreads2(data, infos)] * ROUNDS, count)
+    return results
+
+# a log with the calls of a correct solution: every test_root file is opened and mapped
+def genStraceLog(scale):
+    random.seed("a3_%d" % scale)
+    lines = ['execve("./a3", ["./a3"], 0x7ffd1d3c0a50 /* 20 vars */) = 0']
+    for i in range(50 * scale):
+        fd = 3 + i % 8
+        if random.random() < 0.5:
+            lines.append('openat(AT_FDCWD, "test_root/f%d.dat", O_RDONLY) = %d' % (i, fd))
+        else:
+            lines.append('open("test_root/f%d.dat", O_RDONLY) = %d' % (i, fd))
+        lines.append("mmap(NULL, %d, PROT_READ, MAP_SHARED, %d, 0) = 0x7f%010x" % (4096 * (i % 5 + 1), fd, i * 4096))
+        lines.append('openat(AT_FDCWD, "/etc/ld.so.cache", O_RDONLY|O_CLOEXEC) = %d' % (fd + 8))
+        lines.append('read(%d, "\\177ELF\\2\\1\\1\\0\\0\\0\\0\\0\\0\\0\\0\\0\\3\\0>\\0\\1\\0\\0\\0"..., 832) = 832' % (fd + 8))
+        lines.append("close(%d) = 0" % (fd + 8))
+        lines.append("close(%d) = 0" % fd)
+    lines.append("+++ exited with 0 +++")
+    return "\n".join(lines) + "\n"
+
+def benchA3(tester, data, scale):
+    with open("strace.log", "w") as fout:
+        fout.write(genStraceLog(scale))
+    with open("strace.log") as fin:
+        nrLines = len(fin.readlines())
+    checker = tester.Tester.__new__(tester.Tester)
+    checker.data = data
+    return {"a3.checkStrace": measure([checker.checkStrace] * ROUNDS, nrLines)}
+
+BENCHMARKS = {"a1": benchA1, "a2": benchA2, "a3": benchA3}
+
+def runBenchmarks(assignments, scales, generator):
+    results = {}
+    crtDir = os.getcwd()
+    for assignment in assignments:
+        tester = loadTester(assignment)
+        if generator is not None and hasattr(tester, "GENERATOR_VERSION"):
+            tester.GENERATOR_VERSION = generator
+        data = loadData(assignment)
+        for scale in scales:
+            # every scale gets fresh fixtures in its own directory
+            workDir = tempfile.mkdtemp(prefix="os_bench_")
+            os.chdir(workDir)
+            try:
+                benchResults = BENCHMARKS[assignment](tester, data, scale)
+            finally:
+                os.chdir(crtDir)
+                shutil.rmtree(workDir, ignore_errors=True)
+            for name, summary in benchResults.items():
+                results.setdefault(name, {})[str(scale)] = summary
+                printSummary(name, scale, summary)
+    return results
+
+def printSummary(name, scale, summary):
+    print("%-20s x%-4d %6d ops %14.1f items/s   p50 %9.3f ms   p90 %9.3f ms   p99 %9.3f ms" %
+            (name, scale, summary["ops"], summary["throughput"],
+                summary["p50_ms"], summary["p90_ms"], summary["p99_ms"]))
+
+# returns the number of regressions: a higher p50 latency or a lower throughput than the
+# baseline by more than the threshold
+def compareResults(results, baseline, threshold):
+    regressions = 0
+    print("\nComparison with the baseline (p50 latency / throughput):")
+    for name, scales in results.items():
+        for scale, summary in scales.items():
+            base = baseline.get(name, {}).get(scale)
+            if base is None:
+                continue
+            latencyChange = (summary["p50_ms"] - base["p50_ms"]) / base["p50_ms"] if base["p50_ms"] > 0 else 0.0
+            throughputChange = (summary["throughput"] - base["throughput"]) / base["throughput"] if base["throughput"] > 0 else 0.0
+            if latencyChange > threshold or throughputChange < -threshold:
+                verdict = "\033[1;31mSLOWER\033[0m"
+                regressions += 1
+            elif latencyChange < -threshold and throughputChange > threshold:
+                verdict = "\033[1;32mFASTER\033[0m"
+            else:
+                verdict = "SAME"
+            print("%-20s x%-4s %+8.1f%% %+8.1f%%   %s" %
+                    (name, scale, 100 * latencyChange, 100 * throughputChange, verdict))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(prog="benchmark.py")
+    parser.add_argument("-a", "--assignments",
+        nargs = "+",
+        choices = ASSIGNMENTS,
+        default = list(ASSIGNMENTS),
+        help = "The assignments whose tester is benchmarked.")
+    parser.add_argument("-s", "--scales",
+        nargs = "+",
+        type = int,
+        choices = SCALES,
+        default = list(SCALES),
+        help = "Fixture scales: 1 is the size of the real tests, 10 and 100 multiply the files and threads.")
+    parser.add_argument("-g", "--generator",
+        type = int,
+        choices = (1, 2),
+        default = None,
+        help = "Version of the random generator used for the a1 fixtures (the tester default if missing).")
+    parser.add_argument("--save",
+        metavar = "FILE",
+        help = "Saves the results as a baseline JSON file.")
+    parser.add_argument("--compare",
+        metavar = "FILE",
+        help = "Compares the results with a baseline JSON file; the exit code is 1 if there are regressions.")
+    parser.add_argument("--threshold",
+        type = float,
+        default = 0.1,
+        help = "Relative change reported as a regression when comparing with a baseline.")
+    args = parser.parse_args()
+
+    results = runBenchmarks(args.assignments, sorted(args.scales), args.generator)
+    if args.save:
+        with open(args.save, "w") as fout:
+            json.dump({"python": platform.python_version(), "machine": platform.machine(),
+                        "results": results}, fout, indent=4)
+        print("Baseline saved in %s" % args.save)
+    if args.compare:
+        with open(args.compare) as fin:
+            baseline = json.load(fin)["results"]
+        if compareResults(results, baseline, args.threshold) > 0:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
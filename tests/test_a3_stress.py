@@ -0,0 +1,41 @@
+import importlib.util
+import os
+import shutil
+
+import pytest
+
+A3_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "a3")
+
+
+def loadTester():
+    spec = importlib.util.spec_from_file_location("a3_tester", os.path.join(A3_DIR, "tester.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.mark.parametrize("traceMode", ["strace", "checkmap", "preload"])
+def test_stress_run_is_not_traced(traceMode, tmp_path, monkeypatch):
+    tester = loadTester()
+    shutil.copy(os.path.join(A3_DIR, "a3_data.json"), tmp_path)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(tester, "TRACE_MODE", traceMode)
+    data = tester.loadData()
+
+    stress = tester.makeStressTester(data, tester.loadTests(data), 10)
+
+    assert stress.cmd == ["./%s" % tester.A3_PROG]
+    assert "strace" not in stress.cmd
+    assert stress.env is None or "LD_PRELOAD" not in stress.env
+
+
+def test_regular_tests_keep_their_tracing(tmp_path, monkeypatch):
+    tester = loadTester()
+    shutil.copy(os.path.join(A3_DIR, "a3_data.json"), tmp_path)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(tester, "TRACE_MODE", "strace")
+    data = tester.loadData()
+
+    regular = tester.Tester(data, "ping", None, False)
+
+    assert regular.cmd[0] == "strace"